@@ -0,0 +1,10 @@
+# Artist-Util benchmarks: shared helpers
+
+import sys
+from os import path
+
+BASE_FOLDER = path.join(path.dirname(path.dirname(path.abspath(__file__))),'')
+
+# the benchmarks import lib_artist_util from the extension folder
+if not path.normpath(BASE_FOLDER) in sys.path:
+    sys.path.insert(0,path.normpath(BASE_FOLDER))
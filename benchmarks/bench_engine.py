@@ -0,0 +1,162 @@
+# Artist-Util benchmark: AuEngine on synthetic data
+#
+# Builds a data folder with the given number of names, tags, image
+# subfolders and files per folder, then times AuEngine construction, list
+# selection, image loading, prompt export and HTML export without gradio or
+# a running webui. Results are written as JSON so runs can be compared.
+#
+# usage: python benchmarks/bench_engine.py [--names 10000] [--tags 50]
+#            [--folders 4] [--files 5000] [--report bench_output.json]
+
+import argparse
+import json
+import platform
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from os import path, makedirs
+
+import bench_common
+from lib_artist_util import engine, export
+
+HTML_FOLDERS = 4
+
+#-------------------------------------------------------------------------------
+# Synthetic data
+#-------------------------------------------------------------------------------
+
+WORDS = ['anna','bruno','carla','dmitri','elena','felix','greta','hugo','ines','jonas',
+    'kira','lukas','mara','nils','olga','pavel','quinn','rosa','sven','tara',
+    'ugo','vera','willem','xenia','yuri','zora']
+
+def make_names(num_names, rng):
+    names = set()
+    while len(names)<num_names:
+        names.add(rng.choice(WORDS)+' '+rng.choice(WORDS)+'son '+str(rng.randint(0,num_names*10)))
+    return sorted(names)
+
+def make_data(data_folder, args):
+    rng = random.Random(args.seed)
+    makedirs(path.join(data_folder,'tags'),exist_ok=True)
+    makedirs(path.join(data_folder,'images'),exist_ok=True)
+
+    names = make_names(args.names,rng)
+    with open(path.join(data_folder,'names.txt'),'w',encoding='utf-8') as f:
+        f.write('\n'.join(names))
+    with open(path.join(data_folder,'templates.txt'),'w',encoding='utf-8') as f:
+        f.write('PROMPT, by NAME\nby NAME, PROMPT\nNAME')
+
+    tag_names = ['tag%03d' % n for n in range(args.tags)]
+    tag_data = {x:[] for x in tag_names}
+    for name in names:
+        # about 1 in 5 names stays uncategorized
+        if rng.random()<0.2: continue
+        for tag_name in rng.sample(tag_names,min(len(tag_names),rng.randint(1,3))):
+            tag_data[tag_name].append(name)
+    for tag_name in tag_names:
+        with open(path.join(data_folder,'tags',tag_name+'.txt'),'w',encoding='utf-8') as f:
+            f.write('\n'.join(tag_data[tag_name]))
+
+    from PIL import Image
+    for folder_no in range(args.folders):
+        folder = path.join(data_folder,'images','folder%02d' % folder_no)
+        makedirs(folder,exist_ok=True)
+        # one file per name for the first names, like bulk generated folders
+        for n in range(args.files):
+            if n<len(names):
+                file_name = str(n).zfill(5)+'-'+names[n]+'.png'
+            else:
+                file_name = str(n).zfill(5)+'-unmatched.png'
+            color = (rng.randrange(256),rng.randrange(256),rng.randrange(256))
+            Image.new('RGB',(args.image_size,args.image_size),color).save(path.join(folder,file_name))
+    return names
+
+#-------------------------------------------------------------------------------
+# Benchmark
+#-------------------------------------------------------------------------------
+
+def time_runs(fn, repeat):
+    samples = []
+    for n in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter()-start)
+    return {'min_s':round(min(samples),6), 'median_s':round(statistics.median(samples),6), 'runs':repeat}
+
+def run(data_folder, output_folder, args):
+    results = {}
+
+    results['engine_init'] = time_runs(lambda: engine.AuEngine(path.join(data_folder,'')),args.repeat)
+    au = engine.AuEngine(path.join(data_folder,''))
+
+    session = engine.AuSession(au)
+    results['select_list_all'] = time_runs(lambda: session.select_list(au.SPECIAL_ALL),args.repeat)
+    results['select_list_uncategorized'] = time_runs(lambda: session.select_list(au.SPECIAL_NOTAG),args.repeat)
+    if len(au.tag_choices)>0:
+        results['select_list_tag'] = time_runs(lambda: session.select_list(au.tag_choices[0]),args.repeat)
+
+    folders = au.image_subfolder_choices
+    session.select_list(au.SPECIAL_ALL)
+    sample = session.name_choices[:args.image_names]
+
+    def load_images():
+        for name in sample:
+            for folder in folders:
+                au.load_image(folder,name)
+
+    # the first pass lists and indexes the folders and fills the caches
+    results['load_image_cold'] = time_runs(load_images,1)
+    results['load_image_warm'] = time_runs(load_images,args.repeat)
+    results['load_image_count'] = len(sample)*len(folders)
+
+    results['save_prompts'] = time_runs(lambda: export.export_prompts(au,session.name_choices,session.selected_list,output_folder,'PROMPT, by NAME','test',[]),args.repeat)
+    html_folders = folders[:HTML_FOLDERS]
+    results['save_html'] = time_runs(lambda: export.export_html(au,session.name_choices,html_folders,output_folder),args.repeat)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Artist-Util engine benchmark')
+    parser.add_argument('--names', type=int, default=10000)
+    parser.add_argument('--tags', type=int, default=50)
+    parser.add_argument('--folders', type=int, default=4)
+    parser.add_argument('--files', type=int, default=2000, help='image files per folder')
+    parser.add_argument('--image-size', type=int, default=64)
+    parser.add_argument('--image-names', type=int, default=200, help='names whose images are loaded')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--data', default='', help='reuse or keep the synthetic data folder here')
+    parser.add_argument('--report', default='bench_output.json')
+    args = parser.parse_args()
+
+    engine.stats.enabled = True
+
+    temp_folder = tempfile.mkdtemp(prefix='artist_util_bench_')
+    try:
+        data_folder = args.data if args.data!='' else path.join(temp_folder,'data')
+        if not path.exists(path.join(data_folder,'names.txt')):
+            start = time.perf_counter()
+            make_data(data_folder,args)
+            print('generated data in '+'%.1f' % (time.perf_counter()-start)+'s: '+data_folder)
+        output_folder = path.join(temp_folder,'output')
+        makedirs(output_folder,exist_ok=True)
+        results = run(data_folder,output_folder,args)
+    finally:
+        shutil.rmtree(temp_folder,ignore_errors=True)
+
+    report = {
+        'params': {x:y for x,y in vars(args).items() if x!='report'},
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+        'stats': engine.stats.get_report(),
+        }
+    with open(args.report,'w',encoding='utf-8') as f:
+        json.dump(report,f,indent=1)
+    for name, result in results.items():
+        print('  %-28s %s' % (name,result))
+    print('saved '+args.report)
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,130 @@
+# Artist-Util benchmark: tag membership index vs. list scans
+#
+# Compares AuEngine's tag index (tag -> set of names, name -> tag bitmask)
+# with the list scans it replaced, on synthetic rosters of 1k/10k/100k names.
+#
+# usage: python benchmarks/bench_tag_index.py [--tags 200] [--sizes 1000,10000,100000]
+
+import argparse
+import random
+import tempfile
+import time
+
+import bench_common
+from lib_artist_util import engine
+
+# list scans are quadratic, so for large rosters they are timed on a sample
+# of names and extrapolated to the full roster
+SCAN_SAMPLE = 500
+
+#-------------------------------------------------------------------------------
+# Previous list scan implementation
+#-------------------------------------------------------------------------------
+
+def scan_get_name_tags(au, name):
+    result = []
+    for tag_name in au.tag_choices:
+        if name in au.tag_data[tag_name]:
+            result.append(tag_name)
+    return result
+
+def scan_get_uncategorized_names(au, names):
+    result = []
+    for name in names:
+        found = False
+        for tag_name in au.tag_choices:
+            if name in au.tag_data[tag_name]:
+                found = True
+                break
+        if found==False:
+            result.append(name)
+    return result
+
+def scan_select_tag_list(au, tag_name, names):
+    tag_data = au.tag_data[tag_name]
+    return [name for name in names if name in tag_data]
+
+#-------------------------------------------------------------------------------
+# Benchmark
+#-------------------------------------------------------------------------------
+
+def make_engine(engine, data_folder, num_names, num_tags, seed):
+    rng = random.Random(seed)
+    au = engine.AuEngine(data_folder)
+    au.all_names_list = sorted('artist %07d' % n for n in range(num_names))
+    au.tag_choices = ['tag%03d' % n for n in range(num_tags)]
+    tag_data = {tag_name:[] for tag_name in au.tag_choices}
+    for name in au.all_names_list:
+        # about 1 in 5 names stays uncategorized, the rest get 1-3 tags
+        if rng.random()<0.2: continue
+        for tag_name in rng.sample(au.tag_choices, rng.randint(1,3)):
+            tag_data[tag_name].append(name)
+    au.tag_data = tag_data
+    au.list_choices = [au.SPECIAL_ALL, au.SPECIAL_NOTAG]+au.tag_choices
+    return au
+
+def time_call(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter()-start, result
+
+def run_size(engine, data_folder, num_names, num_tags, seed):
+    au = make_engine(engine, data_folder, num_names, num_tags, seed)
+    rows = []
+
+    build_time, _ = time_call(au.build_tag_index)
+    rows.append(('build index', None, build_time, False))
+
+    names = au.all_names_list
+    sample = names[:SCAN_SAMPLE]
+    scale = len(names)/max(1,len(sample))
+    estimated = len(sample)<len(names)
+
+    # both sides must agree before timing means anything
+    for name in sample:
+        assert au.get_name_tags(name)==scan_get_name_tags(au, name)
+
+    scan_time, _ = time_call(scan_get_uncategorized_names, au, sample)
+    index_time, _ = time_call(au.get_uncategorized_names)
+    rows.append(('uncategorized list', scan_time*scale, index_time, estimated))
+
+    tag_name = au.tag_choices[0]
+    scan_time, _ = time_call(scan_select_tag_list, au, tag_name, sample)
+    index_time, _ = time_call(au.get_list_names, tag_name)
+    rows.append(('select tag list', scan_time*scale, index_time, estimated))
+
+    lookups = sample
+    start = time.perf_counter()
+    for name in lookups:
+        scan_get_name_tags(au, name)
+    scan_time = time.perf_counter()-start
+    start = time.perf_counter()
+    for name in lookups:
+        au.get_name_tags(name)
+    index_time = time.perf_counter()-start
+    rows.append(('get_name_tags x'+str(len(lookups)), scan_time, index_time, False))
+    return rows
+
+def format_seconds(seconds):
+    if seconds==None: return '-'
+    if seconds<1e-3: return '%.1f us' % (seconds*1e6)
+    if seconds<1: return '%.1f ms' % (seconds*1e3)
+    return '%.2f s' % seconds
+
+def main():
+    parser = argparse.ArgumentParser(description='Artist-Util tag index benchmark')
+    parser.add_argument('--tags', type=int, default=200)
+    parser.add_argument('--sizes', default='1000,10000,100000')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_folder:
+        for size in [int(x) for x in args.sizes.split(',')]:
+            print('names: '+str(size)+', tags: '+str(args.tags))
+            for label, scan_time, index_time, estimated in run_size(engine, data_folder, size, args.tags, args.seed):
+                scan_str = format_seconds(scan_time)
+                if estimated: scan_str += ' (est.)'
+                print('  %-24s scan: %-18s index: %s' % (label, scan_str, format_seconds(index_time)))
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,2 @@
+# Artist-Util engine and exports, see scripts/artist_util.py for the webui tab
+# and cli.py for the command line
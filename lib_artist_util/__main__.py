@@ -0,0 +1,5 @@
+import sys
+
+from lib_artist_util.cli import main
+
+sys.exit(main())
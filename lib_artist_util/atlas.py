@@ -0,0 +1,126 @@
+# Artist-Util sprite sheets, many thumbnails packed into a few large images
+#
+# https://github.com/tkalayci71/artist-util
+
+from os import path, makedirs, stat, remove
+from PIL import Image
+import json
+
+from lib_artist_util.engine import stats, open_atomic, map_processes
+
+#-------------------------------------------------------------------------------
+# Options
+#-------------------------------------------------------------------------------
+
+ATLAS_TILE_SIZE = 128 # max width/height of a thumbnail in a sheet
+ATLAS_COLUMNS = 16
+ATLAS_ROWS = 16 # a sheet holds up to ATLAS_COLUMNS*ATLAS_ROWS thumbnails
+ATLAS_FORMAT = 'webp' # 'jpeg'
+ATLAS_QUALITY = 80
+
+#-------------------------------------------------------------------------------
+# Sheets
+#-------------------------------------------------------------------------------
+
+def compose_sheet(images, tile_size, columns):
+    # returns the sheet and (x, y, width, height) of each image in it, None
+    # for images that are None
+    columns = max(1,min(columns,len(images)))
+    num_rows = (len(images)+columns-1)//columns
+    sheet = Image.new('RGB',(columns*tile_size,max(num_rows,1)*tile_size),(255,255,255))
+    tiles = []
+    for n in range(len(images)):
+        img = images[n]
+        if img==None:
+            tiles.append(None)
+            continue
+        if (img.width>tile_size) or (img.height>tile_size):
+            img = img.copy()
+            img.thumbnail((tile_size,tile_size))
+        if img.mode!='RGB':
+            img = img.convert('RGB')
+        x = (n%columns)*tile_size
+        y = (n//columns)*tile_size
+        sheet.paste(img,(x,y))
+        tiles.append((x,y,img.width,img.height))
+    return sheet, tiles
+
+def make_sheet(job):
+    # runs in a worker process, returns (tiles, error messages)
+    sheet_fnam, src_fnams, tile_size, columns, image_format = job
+    images = []
+    errors = []
+    for src_fnam in src_fnams:
+        try:
+            img = Image.open(src_fnam)
+            img.draft('RGB',(tile_size,tile_size))
+            img.thumbnail((tile_size,tile_size))
+            images.append(img)
+        except Exception as e:
+            images.append(None)
+            errors.append(src_fnam+': '+str(e))
+    sheet, tiles = compose_sheet(images,tile_size,columns)
+    try:
+        makedirs(path.dirname(sheet_fnam),exist_ok=True)
+        with open_atomic(sheet_fnam,'wb') as f:
+            sheet.save(f,image_format,quality=ATLAS_QUALITY)
+    except Exception as e:
+        errors.append(sheet_fnam+': '+str(e))
+    return tiles, errors
+
+def get_file_stat(file_name):
+    try:
+        st = stat(file_name)
+        return [st.st_mtime_ns,st.st_size]
+    except OSError:
+        return None
+
+def build_atlas(groups, atlas_folder, atlas_url, tile_size=ATLAS_TILE_SIZE, columns=ATLAS_COLUMNS, rows=ATLAS_ROWS,
+        image_format=ATLAS_FORMAT, num_workers=None):
+    # groups: (group name, [(source file, key)]), each group is split into
+    # sheets named <group name>_<n> in atlas_folder; atlas.json there keeps
+    # each sheet's sources with mtime and size, so only sheets whose sources
+    # changed are made again; returns ({key: (sheet url, x, y, width, height)},
+    # sheets made, sheets up to date, errors)
+    manifest_fnam = path.join(atlas_folder,'atlas.json')
+    try:
+        with open(manifest_fnam,encoding='utf-8') as f:
+            old_sheets = json.load(f).get('sheets',{})
+    except Exception:
+        old_sheets = {}
+    ext = '.jpg' if image_format=='jpeg' else '.'+image_format
+    settings = [tile_size,columns,image_format]
+    per_sheet = max(1,columns*rows)
+    sheets = {}
+    jobs = []
+    for group_name, items in groups:
+        for first in range(0,len(items),per_sheet):
+            sheet_items = items[first:first+per_sheet]
+            sheet_name = group_name+'_'+str(first//per_sheet+1).zfill(4)+ext
+            sources = [[src_fnam,get_file_stat(src_fnam)] for src_fnam, key in sheet_items]
+            sheet = {'settings':settings,'sources':sources,'keys':[key for src_fnam, key in sheet_items]}
+            old_sheet = old_sheets.get(sheet_name,None)
+            sheet_fnam = path.join(atlas_folder,sheet_name)
+            if (old_sheet!=None) and (old_sheet.get('settings')==settings) and (old_sheet.get('sources')==sources) and path.exists(sheet_fnam):
+                sheet['tiles'] = old_sheet['tiles']
+            else:
+                jobs.append((sheet_name,(sheet_fnam,[x[0] for x in sources],tile_size,columns,image_format)))
+            sheets[sheet_name] = sheet
+    stats.count('atlas_sheets',len(jobs))
+    errors = []
+    for (sheet_name, job), (tiles, sheet_errors) in zip(jobs,map_processes(make_sheet,[x[1] for x in jobs],num_workers)):
+        sheets[sheet_name]['tiles'] = tiles
+        errors.extend(sheet_errors)
+    # sheets no longer in use are removed
+    for sheet_name in old_sheets:
+        if (not sheet_name in sheets) and path.exists(path.join(atlas_folder,sheet_name)):
+            remove(path.join(atlas_folder,sheet_name))
+    makedirs(atlas_folder,exist_ok=True)
+    with open_atomic(manifest_fnam) as f:
+        json.dump({'sheets':sheets},f)
+    tile_map = {}
+    for sheet_name, sheet in sheets.items():
+        for key, tile in zip(sheet['keys'],sheet['tiles']):
+            if tile!=None:
+                tile_map[key] = (atlas_url+'/'+sheet_name,)+tuple(tile)
+    return tile_map, len(jobs), len(sheets)-len(jobs), errors
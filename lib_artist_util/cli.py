@@ -0,0 +1,256 @@
+# Artist-Util command line, runs batch jobs without starting the webui
+#
+# python -m lib_artist_util prompts --list favorite --prompt "a castle"
+# python -m lib_artist_util html --folders sd15,sdxl
+# python -m lib_artist_util thumbnails
+# python -m lib_artist_util duplicates --report duplicates.json
+# python -m lib_artist_util similar --name "some artist"
+# python -m lib_artist_util coverage --folders sd15,sdxl
+# python -m lib_artist_util prompts --missing-in sdxl --prompt "a castle"
+# python -m lib_artist_util grid --folders sd15,sdxl --page 2
+
+from os import path
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import time
+
+from lib_artist_util import engine, export, dupes, similar, grid
+from lib_artist_util.engine import AuEngine, AuSession
+
+BASE_FOLDER = path.join(path.dirname(path.dirname(path.abspath(__file__))),'')
+DATA_FOLDER = path.join(BASE_FOLDER,'data','')
+
+#-------------------------------------------------------------------------------
+# Commands
+#-------------------------------------------------------------------------------
+
+def positive_int(text):
+    # argparse type of counts that must be at least 1
+    value = int(text)
+    if value<1: raise argparse.ArgumentTypeError('must be at least 1, not '+text)
+    return value
+
+def get_engine(args, load_assorted=False):
+    # returns the engine and a session with --list selected
+    au = AuEngine(path.join(args.data,''),load_assorted=load_assorted)
+    if not args.list in au.list_choices:
+        print('Error: unknown list "'+args.list+'", lists are: '+', '.join(au.list_choices))
+        return None, None
+    session = AuSession(au)
+    session.select_list(args.list)
+    return au, session
+
+def get_folders(au, folders_text):
+    if folders_text=='':
+        return au.image_subfolder_choices
+    folders = []
+    for folder in folders_text.split(','):
+        folder = folder.strip()
+        if folder=='': continue
+        if not folder in au.image_subfolder_choices:
+            print('warning: no image folder '+folder)
+            continue
+        folders.append(folder)
+    return folders
+
+def get_split_list(text):
+    return [x.strip() for x in text.split(',') if x.strip()!='']
+
+def run_prompts(args):
+    au, session = get_engine(args)
+    if au==None: return 1
+    template_text = args.template if args.template!=None else au.get_default_template()
+    extra_templates = args.also_template
+    if args.all_templates:
+        extra_templates = extra_templates+au.template_choices
+    prompts = args.prompt if len(args.prompt)>0 else ['']
+    names = session.name_choices
+    list_name = session.selected_list
+    if args.missing_in!=None:
+        folders = get_folders(au,args.missing_in)
+        au.coverage.update()
+        names = au.coverage.get_missing_names(names,folders,args.missing_all)
+        list_name = list_name+' (missing in '+('all' if args.missing_all else 'any')+' of: '+', '.join(folders)+')'
+    log_text = export.export_prompts(au,names,list_name,args.output,template_text,'\n'.join(prompts),
+        get_split_list(args.skip),args.include,extra_templates,len(prompts)>1,args.shards,args.sample_rate,args.seed)
+    print(log_text)
+    return 1 if 'Error: ' in log_text else 0
+
+def run_html(args):
+    if args.page_size!=None:
+        export.HTML_PAGE_SIZE = args.page_size
+    if args.thumbnails:
+        export.HTML_THUMBNAILS = True
+    if args.atlas:
+        export.HTML_ATLAS = True
+    au, session = get_engine(args,load_assorted=export.HTML_ADD_ASSORTED)
+    if au==None: return 1
+    log_text = export.export_html(au,session.name_choices,get_folders(au,args.folders),args.output)
+    print(log_text)
+    return 1 if 'Error: ' in log_text else 0
+
+def run_thumbnails(args):
+    if engine.THUMBNAIL_SIZE<=0:
+        print('Error: THUMBNAIL_SIZE is 0, there are no thumbnails to build')
+        return 1
+    engine.PREFETCH_NAMES = 0
+    au, session = get_engine(args)
+    if au==None: return 1
+    folders = get_folders(au,args.folders)
+    jobs = [(folder,name) for name in session.name_choices for folder in folders]
+    # load_image makes the thumbnail and writes it to data/thumbnails
+    with ThreadPoolExecutor(max_workers=max(1,args.workers)) as executor:
+        found = list(executor.map(lambda job: au.load_image(*job)!=None, jobs))
+    print('Thumbnails: '+str(sum(found))+' images for '+str(len(session.name_choices))+' names in '+str(len(folders))+' folders, '+
+        str(len(found)-sum(found))+' missing')
+    return 0
+
+def run_duplicates(args):
+    engine.PREFETCH_NAMES = 0
+    au = AuEngine(path.join(args.data,''))
+    index = dupes.AuHashIndex(au,args.hash,args.workers)
+    if args.name!=None:
+        log_text = dupes.get_name_duplicates_log(index,args.name,args.max_distance)
+    else:
+        log_text = dupes.get_duplicates_log(index,args.max_distance,args.report,args.max_groups)
+    print(log_text)
+    return 1 if 'Error: ' in log_text else 0
+
+def run_coverage(args):
+    engine.PREFETCH_NAMES = 0
+    au, session = get_engine(args)
+    if au==None: return 1
+    print(export.get_coverage_log(au,session.name_choices,session.selected_list,get_folders(au,args.folders)))
+    return 0
+
+def run_grid(args):
+    engine.PREFETCH_NAMES = 0
+    au, session = get_engine(args)
+    if au==None: return 1
+    if args.filter!='':
+        session.set_name_filter(args.filter)
+    names = session.get_filtered_names()
+    folders = get_folders(au,args.folders)
+    if args.page_size!=None:
+        grid.GRID_NAMES = args.page_size
+    grid_view = grid.AuGrid(au)
+    if args.all_pages:
+        pages = range(grid.get_num_pages(len(names),grid.GRID_NAMES))
+    else:
+        pages = [args.page-1]
+    for page in pages:
+        image, page = grid_view.get_page(session.selected_list,names,page,folders,grid.GRID_NAMES)
+        full_path = path.join(args.output,'grid_'+str(page+1).zfill(4)+'.png')
+        try:
+            image.save(full_path)
+        except Exception as e:
+            print('Error: could not save '+full_path+'\n'+str(e))
+            return 1
+        print('Saved '+full_path)
+    return 0
+
+def run_similar(args):
+    engine.PREFETCH_NAMES = 0
+    au, session = get_engine(args)
+    if au==None: return 1
+    folders = get_folders(au,args.folders)
+    index = similar.AuSimilarIndex(au,args.workers)
+    if args.name!=None:
+        name = args.name.strip().lower()
+        print(similar.get_similar_log(name,folders,index.find_similar(name,folders,args.count,session.name_choices)))
+        return 0
+    suggestions = index.suggest_tags(session.name_choices,folders)
+    log_text = similar.save_tag_suggestions(suggestions,session.selected_list,len(session.name_choices),path.join(args.output,'tag_suggestions.txt'))
+    print(log_text)
+    return 1 if 'Error: ' in log_text else 0
+
+#-------------------------------------------------------------------------------
+# Main
+#-------------------------------------------------------------------------------
+
+def add_common_arguments(parser, with_defaults):
+    # on the main parser and on each command, so they can go before or after
+    # the command; the commands have no defaults, or they would overwrite
+    # the values given before the command
+    def get_default(value):
+        return value if with_defaults else argparse.SUPPRESS
+    parser.add_argument('--data',default=get_default(DATA_FOLDER),help='data folder (default: '+DATA_FOLDER+')')
+    parser.add_argument('--list',default=get_default(AuEngine.SPECIAL_ALL),help='tag or list to use (default: '+AuEngine.SPECIAL_ALL+')')
+    parser.add_argument('--stats',action='store_true',default=get_default(False),help='print counters and timings when done')
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog='python -m lib_artist_util',description='Artist-Util batch jobs')
+    add_common_arguments(parser,True)
+    common = argparse.ArgumentParser(add_help=False)
+    add_common_arguments(common,False)
+    commands = parser.add_subparsers(dest='command',required=True)
+
+    prompts = commands.add_parser('prompts',parents=[common],help='generate output.txt')
+    prompts.add_argument('--template',help='template text, NAME and PROMPT are replaced (default: first in templates.txt)')
+    prompts.add_argument('--also-template',action='append',default=[],help='another template, can be repeated')
+    prompts.add_argument('--all-templates',action='store_true',help='also use every template in templates.txt')
+    prompts.add_argument('--prompt',action='append',default=[],help='prompt text, can be repeated')
+    prompts.add_argument('--skip',default='',help='comma separated tags to skip')
+    prompts.add_argument('--include',default='',help='tag expression, e.g. "favorite and not comic", tags with spaces in double quotes')
+    prompts.add_argument('--shards',type=int,default=1,help='number of output files')
+    prompts.add_argument('--sample-rate',type=float,default=1.0)
+    prompts.add_argument('--seed',type=int,default=0)
+    prompts.add_argument('--missing-in',help='only names without an image in these comma separated folders, "" = all folders')
+    prompts.add_argument('--missing-all',action='store_true',help='with --missing-in, only names missing in all of them')
+    prompts.add_argument('--output',default=BASE_FOLDER,help='output folder (default: %(default)s)')
+    prompts.set_defaults(run=run_prompts)
+
+    html = commands.add_parser('html',parents=[common],help='generate html_output.html')
+    html.add_argument('--folders',default='',help='comma separated image folders (default: all)')
+    html.add_argument('--page-size',type=int,help='names per page, 0 = single page (default: HTML_PAGE_SIZE)')
+    html.add_argument('--thumbnails',action='store_true',help='link thumbnails made in html_assets/<size>/')
+    html.add_argument('--atlas',action='store_true',help='show images from sprite sheets made in html_assets/atlas/')
+    html.add_argument('--output',default=BASE_FOLDER,help='output folder (default: %(default)s)')
+    html.set_defaults(run=run_html)
+
+    thumbnails = commands.add_parser('thumbnails',parents=[common],help='fill the panel thumbnail cache in data/thumbnails')
+    thumbnails.add_argument('--folders',default='',help='comma separated image folders (default: all)')
+    thumbnails.add_argument('--workers',type=int,default=engine.LOAD_WORKERS)
+    thumbnails.set_defaults(run=run_thumbnails)
+
+    duplicates = commands.add_parser('duplicates',parents=[common],help='find duplicate and near duplicate images')
+    duplicates.add_argument('--max-distance',type=int,default=dupes.DUPLICATE_MAX_DISTANCE,help='differing bits out of 64 (default: %(default)s)')
+    duplicates.add_argument('--hash',choices=['dhash','phash'],default=dupes.DUPLICATE_HASH)
+    duplicates.add_argument('--name',help='only list duplicates of this name\'s images')
+    duplicates.add_argument('--report',help='save all groups to this JSON file')
+    duplicates.add_argument('--max-groups',type=int,default=50,help='groups printed (default: %(default)s)')
+    duplicates.add_argument('--workers',type=int,default=engine.PROCESS_WORKERS,help='hashing processes, 0 = one per cpu core')
+    duplicates.set_defaults(run=run_duplicates)
+
+    similar_names = commands.add_parser('similar',parents=[common],help='list names with similar images, or suggest tags for the names in --list')
+    similar_names.add_argument('--name',help='list names in --list similar to this one (default: suggest tags, saved to tag_suggestions.txt)')
+    similar_names.add_argument('--folders',default='',help='comma separated image folders (default: all)')
+    similar_names.add_argument('--count',type=int,default=similar.SIMILAR_MAX_RESULTS)
+    similar_names.add_argument('--workers',type=int,default=engine.PROCESS_WORKERS,help='feature processes, 0 = one per cpu core')
+    similar_names.add_argument('--output',default=BASE_FOLDER,help='output folder (default: %(default)s)')
+    similar_names.set_defaults(run=run_similar)
+
+    coverage = commands.add_parser('coverage',parents=[common],help='count names with and without images in each folder')
+    coverage.add_argument('--folders',default='',help='comma separated image folders (default: all)')
+    coverage.set_defaults(run=run_coverage)
+
+    grid_pages = commands.add_parser('grid',parents=[common],help='save pages of names x folders as grid_<page>.png')
+    grid_pages.add_argument('--folders',default='',help='comma separated image folders (default: all)')
+    grid_pages.add_argument('--filter',default='',help='only names containing this text')
+    grid_pages.add_argument('--page',type=int,default=1)
+    grid_pages.add_argument('--all-pages',action='store_true')
+    grid_pages.add_argument('--page-size',type=positive_int,help='names per page (default: GRID_NAMES)')
+    grid_pages.add_argument('--output',default=BASE_FOLDER,help='output folder (default: %(default)s)')
+    grid_pages.set_defaults(run=run_grid)
+    return parser
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    if args.stats:
+        engine.stats.enabled = True
+    start_time = time.perf_counter()
+    result = args.run(args)
+    if args.stats:
+        print(engine.stats.get_json())
+    print('Done in '+'%.3f' % (time.perf_counter()-start_time)+'s')
+    return result
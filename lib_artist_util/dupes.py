@@ -0,0 +1,354 @@
+# Artist-Util duplicate finder, perceptual hashes of images/ and assorted/
+#
+# https://github.com/tkalayci71/artist-util
+
+from os import path, stat
+from itertools import combinations
+from PIL import Image
+import json
+import math
+import threading
+
+from lib_artist_util.engine import timed, stats, get_file_list, load_string_list, save_string_list_atomic, map_processes
+
+#-------------------------------------------------------------------------------
+# Options
+#-------------------------------------------------------------------------------
+
+DUPLICATE_HASH = 'dhash' # 'phash' # phash is slower but better with crops and colour changes
+DUPLICATE_MAX_DISTANCE = 4 # differing bits out of 64 for images to count as near duplicates
+
+#-------------------------------------------------------------------------------
+# Hashes
+#-------------------------------------------------------------------------------
+
+PHASH_SIZE = 32
+PHASH_COS = [[math.cos((2*x+1)*u*math.pi/(2*PHASH_SIZE)) for x in range(PHASH_SIZE)] for u in range(8)]
+
+def get_dhash(img):
+    # 1 bit per horizontally adjacent pixel pair of a 9x8 grayscale image
+    pixels = list(img.convert('L').resize((9,8),Image.BILINEAR).getdata())
+    value = 0
+    for y in range(8):
+        row = pixels[y*9:y*9+9]
+        for x in range(8):
+            value = (value<<1) | (1 if row[x]<row[x+1] else 0)
+    return value
+
+def get_phash(img):
+    # 1 bit per low frequency DCT coefficient of a 32x32 grayscale image,
+    # set if the coefficient is above the median
+    pixels = list(img.convert('L').resize((PHASH_SIZE,PHASH_SIZE),Image.BILINEAR).getdata())
+    rows = [pixels[y*PHASH_SIZE:(y+1)*PHASH_SIZE] for y in range(PHASH_SIZE)]
+    row_dct = [[sum(c*p for c,p in zip(cos_u,row)) for cos_u in PHASH_COS] for row in rows]
+    dct = [sum(PHASH_COS[v][y]*row_dct[y][u] for y in range(PHASH_SIZE)) for v in range(8) for u in range(8)]
+    median = sorted(dct[1:])[31]
+    value = 0
+    for coefficient in dct:
+        value = (value<<1) | (1 if coefficient>median else 0)
+    return value
+
+def get_file_hash(job):
+    # runs in a worker process, returns None for files that are not images
+    file_name, method = job
+    try:
+        img = Image.open(file_name)
+        img.draft('L',(64,64))
+        if method=='phash':
+            return get_phash(img)
+        return get_dhash(img)
+    except Exception:
+        return None
+
+def get_hamming_distance(a, b):
+    return bin(a^b).count('1')
+
+#-------------------------------------------------------------------------------
+# AuHammingIndex class
+#-------------------------------------------------------------------------------
+
+class AuHammingIndex:
+
+    # multi-index hashing: hashes are split into num_chunks slices, and two
+    # hashes within max_dist bits of each other have at least one slice within
+    # max_dist//num_chunks bits, so find() only compares hashes from the
+    # buckets of those slice values; the number of slices is picked per
+    # max_dist to keep lookups and bucket sizes small, and each set of
+    # buckets is built on first use
+
+    MAX_CHUNKS = 16
+
+    def __init__(self):
+        self.values = set()
+        self.tables = {} # num_chunks -> one {slice value: [values]} per slice
+        self.plans = {}
+
+    def get_chunks(self, num_chunks):
+        # (shift, mask) of each slice
+        result = []
+        for n in range(num_chunks):
+            first = 64*n//num_chunks
+            last = 64*(n+1)//num_chunks
+            result.append((first,(1<<(last-first))-1))
+        return result
+
+    def get_plan(self, max_dist):
+        # (estimated cost, num_chunks, chunks, flip masks within the radius)
+        key = (max_dist,len(self.values).bit_length())
+        plan = self.plans.get(key,None)
+        if plan!=None: return plan
+        for num_chunks in range(1,min(max_dist+1,self.MAX_CHUNKS)+1):
+            radius = max_dist//num_chunks
+            num_bits = 64//num_chunks
+            num_keys = sum(math.comb(num_bits+1,r) for r in range(radius+1))
+            cost = num_chunks*num_keys*(1+len(self.values)/(1<<num_bits))
+            if (plan==None) or (cost<plan[0]):
+                plan = (cost,num_chunks,radius)
+        cost, num_chunks, radius = plan
+        chunks = self.get_chunks(num_chunks)
+        max_bits = max(x[1] for x in chunks).bit_length()
+        flips = [0]
+        for r in range(1,radius+1):
+            flips.extend(sum(1<<b for b in bits) for bits in combinations(range(max_bits),r))
+        plan = (cost,num_chunks,chunks,flips)
+        self.plans[key] = plan
+        return plan
+
+    def add(self, value):
+        if value in self.values: return
+        self.values.add(value)
+        for num_chunks, tables in self.tables.items():
+            self.add_to_tables(value,self.get_chunks(num_chunks),tables)
+
+    def add_to_tables(self, value, chunks, tables):
+        for table, (shift, mask) in zip(tables,chunks):
+            table.setdefault((value>>shift)&mask,[]).append(value)
+
+    def get_tables(self, num_chunks, chunks):
+        tables = self.tables.get(num_chunks,None)
+        if tables==None:
+            tables = [{} for x in chunks]
+            for value in self.values:
+                self.add_to_tables(value,chunks,tables)
+            self.tables[num_chunks] = tables
+        return tables
+
+    def find(self, value, max_dist):
+        # returns (distance, value) pairs
+        if max_dist<=0:
+            return [(0,value)] if value in self.values else []
+        cost, num_chunks, chunks, flips = self.get_plan(max_dist)
+        tables = self.get_tables(num_chunks,chunks)
+        result = []
+        seen = set()
+        for table, (shift, mask) in zip(tables,chunks):
+            chunk = (value>>shift)&mask
+            for flip in flips:
+                if flip>mask: continue
+                for other in table.get(chunk^flip,()):
+                    if other in seen: continue
+                    seen.add(other)
+                    dist = get_hamming_distance(value,other)
+                    if dist<=max_dist:
+                        result.append((dist,other))
+        return result
+
+#-------------------------------------------------------------------------------
+# AuHashIndex class
+#-------------------------------------------------------------------------------
+
+class AuHashIndex:
+
+    # hashes of every file under images/ and assorted/, keyed by paths
+    # relative to the data folder ('images/<folder>/<file>', 'assorted/<file>');
+    # cached in data/image_hashes.txt with mtime and size, so update() only
+    # hashes new or changed files
+
+    def __init__(self, au, method=DUPLICATE_HASH, num_workers=None):
+        self.au = au
+        self.method = method
+        self.num_workers = num_workers
+        self.cache_fnam = path.join(au.data_folder,'image_hashes.txt')
+        self.lock = threading.Lock()
+        self.records = None # rel path -> (mtime_ns, size, hash or None)
+        self.hash_files = {} # hash -> rel paths
+        self.hamming_index = AuHammingIndex()
+
+    def load_cache(self):
+        self.records = {}
+        for line in load_string_list(self.cache_fnam):
+            fields = line.split('\t')
+            if (len(fields)!=5) or (fields[0]!=self.method): continue
+            try:
+                value = None if fields[4]=='-' else int(fields[4],16)
+                self.records[fields[1]] = (int(fields[2]),int(fields[3]),value)
+            except ValueError:
+                continue
+
+    def save_cache(self):
+        lines = []
+        for rel_path, (mtime, size, value) in self.records.items():
+            value_str = '-' if value==None else '%016x' % value
+            lines.append(self.method+'\t'+rel_path+'\t'+str(mtime)+'\t'+str(size)+'\t'+value_str)
+        save_string_list_atomic(lines,self.cache_fnam)
+
+    def list_files(self):
+        # rel path -> full file name
+        result = {}
+        for folder in self.au.image_subfolder_choices:
+            image_files = self.au.get_image_files(folder)
+            if image_files==None: continue
+            for file_name in image_files:
+                result['images/'+folder+'/'+file_name] = path.join(self.au.images_folder,folder,file_name)
+        for file_name in get_file_list(self.au.assorted_folder):
+            result['assorted/'+file_name] = path.join(self.au.assorted_folder,file_name)
+        return result
+
+    def add_to_index(self, rel_path, value):
+        if value==None: return
+        files = self.hash_files.get(value,None)
+        if files==None:
+            self.hash_files[value] = [rel_path]
+            self.hamming_index.add(value)
+        else:
+            files.append(rel_path)
+
+    def build_index(self):
+        self.hash_files = {}
+        self.hamming_index = AuHammingIndex()
+        for rel_path, record in self.records.items():
+            self.add_to_index(rel_path,record[2])
+
+    @timed('dupes.update')
+    def update(self):
+        # returns (files hashed, files removed)
+        with self.lock:
+            rebuild = False
+            if self.records==None:
+                self.load_cache()
+                rebuild = True
+            files = self.list_files()
+            removed = [x for x in self.records if not x in files]
+            for rel_path in removed:
+                del self.records[rel_path]
+            jobs = []
+            for rel_path, file_name in files.items():
+                try:
+                    st = stat(file_name)
+                except OSError:
+                    continue
+                record = self.records.get(rel_path,None)
+                if record!=None:
+                    if (record[0]==st.st_mtime_ns) and (record[1]==st.st_size): continue
+                    rebuild = True
+                jobs.append((rel_path,file_name,st.st_mtime_ns,st.st_size))
+            stats.count('image_hashes',len(jobs))
+            values = map_processes(get_file_hash,[(x[1],self.method) for x in jobs],self.num_workers,chunksize=64,min_jobs=65)
+            for job, value in zip(jobs,values):
+                self.records[job[0]] = (job[2],job[3],value)
+            # new files are added to the index, removed or changed ones need a rebuild
+            if rebuild or (len(removed)>0):
+                self.build_index()
+            else:
+                for job, value in zip(jobs,values):
+                    self.add_to_index(job[0],value)
+            if (len(jobs)>0) or (len(removed)>0):
+                self.save_cache()
+            return len(jobs), len(removed)
+
+    def get_num_files(self):
+        return 0 if self.records==None else len(self.records)
+
+    @timed('dupes.find_duplicates')
+    def find_duplicates(self, max_dist):
+        # groups of rel paths within max_dist of each other, largest first
+        with self.lock:
+            parents = {}
+            def get_root(value):
+                while parents.get(value,value)!=value:
+                    value = parents[value]
+                return value
+            if max_dist>0:
+                for value in self.hash_files:
+                    for dist, other in self.hamming_index.find(value,max_dist):
+                        a, b = get_root(value), get_root(other)
+                        if a!=b: parents[b] = a
+            groups = {}
+            for value, files in self.hash_files.items():
+                groups.setdefault(get_root(value),[]).extend(files)
+        result = [sorted(files) for files in groups.values() if len(files)>1]
+        result.sort(key=lambda files: (-len(files),files[0]))
+        return result
+
+    @timed('dupes.find_name_duplicates')
+    def find_name_duplicates(self, name, max_dist):
+        # (rel path, [(distance, other rel path)]) for files matching name
+        name = name.strip().lower()
+        if name=='': return []
+        result = []
+        with self.lock:
+            for rel_path, record in self.records.items():
+                if record[2]==None: continue
+                if not name in rel_path[rel_path.rfind('/')+1:].lower(): continue
+                matches = []
+                for dist, value in self.hamming_index.find(record[2],max_dist):
+                    matches.extend((dist,x) for x in self.hash_files[value] if x!=rel_path)
+                if len(matches)>0:
+                    result.append((rel_path,sorted(matches)))
+        result.sort()
+        return result
+
+    def get_wasted_bytes(self, groups):
+        # bytes freed by keeping only the largest file of each group
+        total = 0
+        for files in groups:
+            sizes = [self.records[x][1] for x in files if x in self.records]
+            total += sum(sizes)-max(sizes,default=0)
+        return total
+
+    def save_report(self, groups, max_dist, file_name):
+        report = {
+            'method': self.method,
+            'max_distance': max_dist,
+            'files': self.get_num_files(),
+            'groups': len(groups),
+            'wasted_bytes': self.get_wasted_bytes(groups),
+            'duplicates': [{'files':files,'bytes':[self.records[x][1] for x in files]} for files in groups],
+            }
+        with open(file_name,'w',encoding='utf-8') as f:
+            json.dump(report,f,indent=1)
+
+#-------------------------------------------------------------------------------
+# Logs
+#-------------------------------------------------------------------------------
+
+def get_update_log(index):
+    num_hashed, num_removed = index.update()
+    return 'Hashed '+str(num_hashed)+' new or changed files, removed '+str(num_removed)+', '+str(index.get_num_files())+' files indexed'
+
+def get_duplicates_log(index, max_dist, report_fnam=None, max_groups=50):
+    log = [get_update_log(index)]
+    groups = index.find_duplicates(max_dist)
+    log.append('Found '+str(len(groups))+' groups with '+str(sum(len(x) for x in groups))+' files within distance '+str(max_dist)+
+        ', '+'%.1f' % (index.get_wasted_bytes(groups)/(1024*1024))+' MB could be freed')
+    if report_fnam!=None:
+        try:
+            index.save_report(groups,max_dist,report_fnam)
+            log.append('Saved '+report_fnam)
+        except Exception as e:
+            log.append('Error: could not save '+report_fnam+'\n'+str(e))
+    for files in groups[:max_groups]:
+        log.append(', '.join(files))
+    if len(groups)>max_groups:
+        log.append('... '+str(len(groups)-max_groups)+' more groups')
+    return '\n'.join(log)
+
+def get_name_duplicates_log(index, name, max_dist):
+    log = [get_update_log(index)]
+    matches = index.find_name_duplicates(name,max_dist)
+    log.append('Name: "'+name+'", '+str(len(matches))+' files with duplicates within distance '+str(max_dist))
+    for rel_path, others in matches:
+        log.append(rel_path)
+        for dist, other in others:
+            log.append('  '+str(dist)+' '+other)
+    return '\n'.join(log)
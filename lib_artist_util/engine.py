@@ -0,0 +1,1679 @@
+# Artist-Util engine, importable without the webui
+#
+# https://github.com/tkalayci71/artist-util
+
+from os import path, scandir, makedirs, stat, replace, remove, utime, getpid
+from collections import deque, OrderedDict
+from bisect import bisect_left, insort
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import partial, wraps
+from contextlib import contextmanager
+from copy import copy
+from weakref import WeakKeyDictionary
+from array import array
+from PIL import Image
+import hashlib
+import json
+import multiprocessing
+import re
+import sqlite3
+import threading
+import time
+
+#-------------------------------------------------------------------------------
+# Options
+#-------------------------------------------------------------------------------
+
+USE_CATALOG = False # True # keep names, tags and templates in data/catalog.db instead of text files
+TAG_SAVE_DELAY = 2.0 # seconds after the last tag change before tag files are written, 0 = immediately
+
+IMAGE_RESCAN_INTERVAL = 1.0 # seconds between mtime checks of an image folder
+
+THUMBNAIL_SIZE = 512 # max width/height of images shown in folder panels, 0 = full size
+THUMBNAIL_CACHE_MB = 256 # memory budget for decoded thumbnails
+THUMBNAIL_DISK_CACHE = True # False # also keep thumbnails in data/thumbnails/
+THUMBNAIL_DISK_CACHE_MB = 1024 # disk budget for data/thumbnails/, the least recently used are removed, 0 = no limit
+
+PREFETCH_NAMES = 3 # thumbnails of this many next/prev names are loaded in background, 0 = off
+PREFETCH_WORKERS = 2
+
+LOAD_WORKERS = 4 # threads decoding the folder panels and assorted images of a name, 1 = no threads
+PROCESS_WORKERS = 0 # processes hashing images, computing image features and making sheets and html thumbnails, 0 = one per cpu core
+
+SEARCH_MAX_FUZZY = 1000 # names checked for close matches per search, those sharing most of the text first
+
+ENABLE_STATS = False # True # count scans/reads/decodes and time engine calls and UI handlers, see Stats panel
+
+#-------------------------------------------------------------------------------
+# Stats
+#-------------------------------------------------------------------------------
+
+class AuStats:
+
+    # counters and recent call durations, only recorded while enabled
+
+    MAX_SAMPLES = 1000
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.timings = {}
+
+    def count(self, name, n=1):
+        if not self.enabled: return
+        with self.lock:
+            self.counters[name] = self.counters.get(name,0)+n
+
+    def add_time(self, name, seconds):
+        with self.lock:
+            samples = self.timings.get(name,None)
+            if samples==None:
+                samples = deque(maxlen=self.MAX_SAMPLES)
+                self.timings[name] = samples
+            samples.append(seconds)
+
+    @contextmanager
+    def timer(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name,time.perf_counter()-start)
+
+    def get_report(self):
+        with self.lock:
+            counters = dict(self.counters)
+            timings = {x:sorted(y) for x,y in self.timings.items()}
+        report = {'counters':counters, 'timings':{}}
+        for name in sorted(timings):
+            samples = timings[name]
+            n = len(samples)
+            report['timings'][name] = {
+                'count': n,
+                'total_ms': round(sum(samples)*1000,3),
+                'p50_ms': round(samples[int(0.5*(n-1))]*1000,3),
+                'p90_ms': round(samples[int(0.9*(n-1))]*1000,3),
+                'p99_ms': round(samples[int(0.99*(n-1))]*1000,3),
+                'max_ms': round(samples[-1]*1000,3),
+                }
+        return report
+
+    def get_json(self):
+        return json.dumps(self.get_report(),indent=1)
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.timings = {}
+
+stats = AuStats(ENABLE_STATS)
+
+def timed(name):
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not stats.enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                stats.add_time(name,time.perf_counter()-start)
+        return wrapper
+    return decorator
+
+#-------------------------------------------------------------------------------
+# Utils
+#-------------------------------------------------------------------------------
+
+def make_sure_dir_exists(dir_name):
+    if not path.exists(dir_name):
+        makedirs(dir_name)
+    if not path.exists(dir_name):
+        raise
+
+def get_folder_list(dir_name):
+    if not path.exists(dir_name):
+        return []
+    stats.count('scans')
+    result = []
+    for it in scandir(dir_name):
+        if it.is_dir():
+            result.append(it.name)
+    return result
+
+def get_file_list(dir_name, ext='', remove_ext=False):
+    if not path.exists(dir_name):
+         return []
+    stats.count('scans')
+    result = []
+    for it in scandir(dir_name):
+        if it.is_file():
+            if ext!='':
+                if not it.name.endswith('.'+ext):
+                    continue
+            file_name = it.name
+            if remove_ext:
+                file_name = path.splitext(file_name)[0]
+            result.append(file_name)
+    return result
+
+def load_string_list(file_name, process=False, addempty=False):
+    if not path.exists(file_name):
+        return []
+    stats.count('file_reads')
+    result=[]
+    with open(file_name,encoding='utf-8') as f:
+        lines = f.readlines()
+        for line in lines:
+            line = line.replace('\n','')
+            line = line.strip()
+            if (addempty==True) or (line!=''):
+                result.append(line)
+        f.close()
+    if process:
+        result = [x.lower() for x in result]
+        old_len = len(result)
+        result = list(dict.fromkeys(result))
+        new_len = len(result)
+        if (old_len!=new_len):
+            print('warning : ignoring ',str(new_len-old_len),' duplicates in ',file_name)
+        result.sort()
+    return result
+
+def save_string_list(string_list, file_name, overwrite):
+    if path.exists(file_name):
+        if overwrite==False:
+            return
+    with open(file_name,'w',encoding='utf-8',) as f:
+        f.writelines('\n'.join(string_list))
+        f.close()
+    return
+
+@contextmanager
+def open_atomic(file_name, mode='w'):
+    # a temp file next to file_name that is swapped in when the block ends
+    # without an error, so a crash never leaves a truncated file behind
+    temp_name = file_name+'.'+str(getpid())+'.'+str(threading.get_ident())+'.tmp'
+    try:
+        with open(temp_name,mode,encoding=None if 'b' in mode else 'utf-8') as f:
+            yield f
+        replace(temp_name,file_name)
+    finally:
+        if path.exists(temp_name):
+            remove(temp_name)
+
+def save_string_list_atomic(string_list, file_name):
+    with open_atomic(file_name) as f:
+        f.writelines('\n'.join(string_list))
+
+def map_processes(fn, jobs, num_workers=None, chunksize=1, min_jobs=2):
+    # fn over jobs in worker processes, or inline for fewer than min_jobs;
+    # None workers = PROCESS_WORKERS; the processes are spawned, not forked,
+    # so they don't copy the whole webui process and its threads; fn must be
+    # importable by name in them, where processes fail threads are used
+    if len(jobs)<min_jobs:
+        return [fn(job) for job in jobs]
+    if num_workers==None:
+        num_workers = PROCESS_WORKERS
+    num_workers = num_workers if num_workers>0 else None
+    try:
+        with ProcessPoolExecutor(max_workers=num_workers,mp_context=multiprocessing.get_context('spawn')) as executor:
+            return list(executor.map(fn,jobs,chunksize=chunksize))
+    except Exception as e:
+        print('warning: worker processes failed, using threads ('+str(e)+')')
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            return list(executor.map(fn,jobs))
+
+def save_string_iter(string_iter, file_name, chunk_size=1000):
+    # like save_string_list, but consumes the lines as they are generated
+    num_lines = 0
+    with open(file_name,'w',encoding='utf-8') as f:
+        chunk = []
+        for line in string_iter:
+            chunk.append(line)
+            if len(chunk)>=chunk_size:
+                if num_lines>0: f.write('\n')
+                f.write('\n'.join(chunk))
+                num_lines += len(chunk)
+                chunk = []
+        if len(chunk)>0:
+            if num_lines>0: f.write('\n')
+            f.write('\n'.join(chunk))
+            num_lines += len(chunk)
+    return num_lines
+
+class AuShardWriter:
+
+    # writes lines round-robin into one or more files, in buffered chunks;
+    # a file is only created once it gets its first line
+
+    def __init__(self, file_names, chunk_size=1000):
+        self.file_names = file_names
+        self.chunk_size = chunk_size
+        self.files = [None]*len(file_names)
+        self.chunks = [[] for x in file_names]
+        self.counts = [0]*len(file_names)
+        self.next_shard = 0
+
+    def write(self, line):
+        shard = self.next_shard
+        self.next_shard = (shard+1)%len(self.file_names)
+        chunk = self.chunks[shard]
+        chunk.append(line)
+        if len(chunk)>=self.chunk_size:
+            self.flush_shard(shard)
+
+    def flush_shard(self, shard):
+        chunk = self.chunks[shard]
+        if len(chunk)==0: return
+        f = self.files[shard]
+        if f==None:
+            f = open(self.file_names[shard],'w',encoding='utf-8')
+            self.files[shard] = f
+        if self.counts[shard]>0: f.write('\n')
+        f.write('\n'.join(chunk))
+        self.counts[shard] += len(chunk)
+        self.chunks[shard] = []
+
+    def close(self):
+        for shard in range(len(self.file_names)):
+            self.flush_shard(shard)
+            if self.files[shard]!=None:
+                self.files[shard].close()
+                self.files[shard] = None
+        return sum(self.counts)
+
+def get_list_index(source_list, item, is_list_sorted=False):
+    if is_list_sorted and isinstance(item,str):
+        found_index = bisect_left(source_list,item)
+        if (found_index<len(source_list)) and (source_list[found_index]==item):
+            return found_index
+        return -1
+    try:
+        found_index = source_list.index(item)
+    except:
+        found_index = -1
+    return found_index
+
+#-------------------------------------------------------------------------------
+# AuNameMatcher class
+#-------------------------------------------------------------------------------
+
+class AuNameMatcher:
+
+    # Aho-Corasick automaton over a set of names, finds every name that occurs
+    # in a text with a single pass over the text
+
+    def __init__(self, names):
+        self.names = set()
+        self.goto = [{}]
+        self.output = [None]
+        for name in names:
+            if (name=='') or (name in self.names): continue
+            self.names.add(name)
+            node = 0
+            for ch in name:
+                next_node = self.goto[node].get(ch,None)
+                if next_node==None:
+                    next_node = len(self.goto)
+                    self.goto.append({})
+                    self.output.append(None)
+                    self.goto[node][ch] = next_node
+                node = next_node
+            self.output[node] = name
+
+        # fail: longest proper suffix that is also in the trie
+        # output_link: nearest node on the fail chain that ends a name (0 = none)
+        self.fail = [0]*len(self.goto)
+        self.output_link = [0]*len(self.goto)
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self.goto[node].items():
+                fail_node = self.fail[node]
+                while (fail_node!=0) and (not ch in self.goto[fail_node]):
+                    fail_node = self.fail[fail_node]
+                fail_node = self.goto[fail_node].get(ch,0)
+                self.fail[child] = fail_node
+                if self.output[fail_node]!=None:
+                    self.output_link[child] = fail_node
+                else:
+                    self.output_link[child] = self.output_link[fail_node]
+                queue.append(child)
+
+    def find_all(self, text):
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        output_link = self.output_link
+        result = set()
+        node = 0
+        for ch in text:
+            while (node!=0) and (not ch in goto[node]):
+                node = fail[node]
+            node = goto[node].get(ch,0)
+            out = node if output[node]!=None else output_link[node]
+            while out!=0:
+                result.add(output[out])
+                out = output_link[out]
+        return result
+
+#-------------------------------------------------------------------------------
+# AuCatalog class
+#-------------------------------------------------------------------------------
+
+class AuCatalog:
+
+    # sqlite store for names, tags and settings, filled from and exportable
+    # to the text file layout in the data folder
+
+    def __init__(self, db_fnam):
+        self.db_fnam = db_fnam
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(db_fnam,check_same_thread=False)
+        with self.lock, self.db:
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute('CREATE TABLE IF NOT EXISTS names (name TEXT PRIMARY KEY) WITHOUT ROWID')
+            self.db.execute('CREATE TABLE IF NOT EXISTS tags (tag TEXT PRIMARY KEY) WITHOUT ROWID')
+            self.db.execute('CREATE TABLE IF NOT EXISTS name_tags (tag TEXT, name TEXT, PRIMARY KEY (tag,name)) WITHOUT ROWID')
+            self.db.execute('CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID')
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def is_empty(self):
+        with self.lock:
+            row = self.db.execute('SELECT (SELECT count(*) FROM names)+(SELECT count(*) FROM tags)').fetchone()
+        return row[0]==0
+
+    def get_names(self):
+        with self.lock:
+            return [x[0] for x in self.db.execute('SELECT name FROM names ORDER BY name')]
+
+    def get_tags(self):
+        with self.lock:
+            return [x[0] for x in self.db.execute('SELECT tag FROM tags ORDER BY tag')]
+
+    def get_tag_data(self):
+        with self.lock:
+            tag_data = {x[0]:[] for x in self.db.execute('SELECT tag FROM tags')}
+            for tag_name, name in self.db.execute('SELECT tag, name FROM name_tags ORDER BY tag, name'):
+                tag_data[tag_name].append(name)
+        return tag_data
+
+    def get_setting(self, key, default=None):
+        with self.lock:
+            row = self.db.execute('SELECT value FROM settings WHERE key=?',(key,)).fetchone()
+        return default if row==None else row[0]
+
+    def set_setting(self, key, value):
+        with self.lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO settings (key,value) VALUES (?,?)',(key,value))
+
+    def get_string_list(self, key):
+        value = self.get_setting(key,None)
+        return [] if value==None else value.split('\n')
+
+    def set_string_list(self, key, string_list):
+        self.set_setting(key,'\n'.join(string_list))
+
+    def add_tag(self, tag_name, names):
+        with self.lock, self.db:
+            self.db.execute('INSERT OR IGNORE INTO tags (tag) VALUES (?)',(tag_name,))
+            self.db.executemany('INSERT OR IGNORE INTO name_tags (tag,name) VALUES (?,?)',((tag_name,x) for x in names))
+
+    def save_tags(self, tag_data):
+        # replaces the names of the given tags in one transaction
+        with self.lock, self.db:
+            for tag_name, names in tag_data.items():
+                self.db.execute('INSERT OR IGNORE INTO tags (tag) VALUES (?)',(tag_name,))
+                self.db.execute('DELETE FROM name_tags WHERE tag=?',(tag_name,))
+                self.db.executemany('INSERT INTO name_tags (tag,name) VALUES (?,?)',((tag_name,x) for x in names))
+
+    def import_text(self, data_folder):
+        tags_folder = path.join(data_folder,'tags','')
+        names = load_string_list(path.join(data_folder,'names.txt'),process=True)
+        tag_data = {}
+        for tag_name in get_file_list(tags_folder,ext='txt',remove_ext=True):
+            tag_data[tag_name] = load_string_list(path.join(tags_folder,tag_name+'.txt'),process=True)
+        templates = load_string_list(path.join(data_folder,'templates.txt'),process=False)
+        last_folders = load_string_list(path.join(data_folder,'last_folders.txt'),process=False,addempty=True)
+        with self.lock, self.db:
+            for table in ['names','tags','name_tags','settings']:
+                self.db.execute('DELETE FROM '+table)
+            self.db.executemany('INSERT INTO names (name) VALUES (?)',((x,) for x in names))
+            for tag_name, tag_names in tag_data.items():
+                self.db.execute('INSERT INTO tags (tag) VALUES (?)',(tag_name,))
+                self.db.executemany('INSERT INTO name_tags (tag,name) VALUES (?,?)',((tag_name,x) for x in tag_names))
+            self.db.execute('INSERT INTO settings (key,value) VALUES (?,?)',('templates','\n'.join(templates)))
+            if len(last_folders)>0:
+                self.db.execute('INSERT INTO settings (key,value) VALUES (?,?)',('last_folders','\n'.join(last_folders)))
+        return len(names), len(tag_data)
+
+    def export_text(self, data_folder):
+        tags_folder = path.join(data_folder,'tags','')
+        make_sure_dir_exists(tags_folder)
+        names = self.get_names()
+        tag_data = self.get_tag_data()
+        save_string_list_atomic(names,path.join(data_folder,'names.txt'))
+        for tag_name, tag_names in tag_data.items():
+            save_string_list_atomic(tag_names,path.join(tags_folder,tag_name+'.txt'))
+        save_string_list_atomic(self.get_string_list('templates'),path.join(data_folder,'templates.txt'))
+        last_folders = self.get_setting('last_folders',None)
+        if last_folders!=None:
+            save_string_list_atomic(last_folders.split('\n'),path.join(data_folder,'last_folders.txt'))
+        return len(names), len(tag_data)
+
+#-------------------------------------------------------------------------------
+# AuSearchIndex class
+#-------------------------------------------------------------------------------
+
+def get_grams(text, size):
+    return set(text[n:n+size] for n in range(len(text)-size+1))
+
+def get_substring_distance(pattern, text, max_dist):
+    # smallest edit distance between pattern and any substring of text,
+    # max_dist+1 if it is larger than max_dist
+    prev_row = [0]*(len(text)+1)
+    for i in range(1,len(pattern)+1):
+        ch = pattern[i-1]
+        row = [i]
+        row_min = i
+        for j in range(1,len(text)+1):
+            cost = prev_row[j-1] if text[j-1]==ch else prev_row[j-1]+1
+            if prev_row[j]+1<cost: cost = prev_row[j]+1
+            if row[j-1]+1<cost: cost = row[j-1]+1
+            row.append(cost)
+            if cost<row_min: row_min = cost
+        if row_min>max_dist: return max_dist+1
+        prev_row = row
+    return min(min(prev_row),max_dist+1)
+
+class AuSearchIndex:
+
+    # trigram and bigram postings for substring and fuzzy candidates, sorted
+    # word list (bisect range = prefix trie walk) for prefix matches
+
+    RANK_EXACT = 0
+    RANK_PREFIX = 1
+    RANK_WORD_PREFIX = 2
+    RANK_SUBSTRING = 3
+    RANK_FUZZY = 4 # + number of edits
+
+    def __init__(self, names):
+        self.names = list(names)
+        self.name_ids = {}
+        self.trigrams = {}
+        self.bigrams = {}
+        words = []
+        for name_id in range(len(self.names)):
+            name = self.names[name_id]
+            self.name_ids[name] = name_id
+            for trigram in get_grams(name,3):
+                self.trigrams.setdefault(trigram,[]).append(name_id)
+            for bigram in get_grams(name,2):
+                self.bigrams.setdefault(bigram,[]).append(name_id)
+            for word in name.split():
+                words.append((word,name_id))
+        words.sort()
+        self.words = [x[0] for x in words]
+        self.word_name_ids = [x[1] for x in words]
+
+    def get_max_edits(self, query):
+        # shorter queries get no close matches, too many names are one edit
+        # away from them
+        if len(query)<5: return 0
+        if len(query)<8: return 1
+        return 2
+
+    def get_prefix_ids(self, prefix):
+        start = bisect_left(self.words,prefix)
+        end = bisect_left(self.words,prefix+'\uffff')
+        return set(self.word_name_ids[start:end])
+
+    def get_gram_counts(self, postings, grams):
+        # per name, how many of the query's gram positions have a gram that
+        # occurs in the name
+        counts = {}
+        for gram in set(grams):
+            weight = grams.count(gram)
+            for name_id in postings.get(gram,[]):
+                counts[name_id] = counts.get(name_id,0)+weight
+        return counts
+
+    def search(self, query, name_choices=None):
+        # returns (rank, name) pairs of matching names, best first; with
+        # name_choices only those names are returned, in their order on ties
+        query = ' '.join(query.strip().lower().split())
+        if query=='': return []
+        if name_choices==None: name_choices = self.names
+        allowed = set(name_choices)
+        order = {}
+
+        ranks = {}
+        if len(query)<3:
+            candidates = [name for name in name_choices if query in name]
+        else:
+            max_edits = self.get_max_edits(query)
+            # every edit spoils at most 3 of the query's trigram positions (2
+            # bigram positions), names keeping fewer can't match; bigrams are
+            # used where the edits could spoil all trigrams
+            size = 3 if len(query)-2-3*max_edits>=1 else 2
+            postings = self.trigrams if size==3 else self.bigrams
+            grams = [query[n:n+size] for n in range(len(query)-size+1)]
+            min_count = len(grams)-size*max_edits
+            counts = self.get_gram_counts(postings,grams)
+            candidates = []
+            fuzzy = []
+            for name_id, count in counts.items():
+                if count<min_count: continue
+                name = self.names[name_id]
+                if not name in allowed: continue
+                if query in name:
+                    candidates.append(name)
+                elif max_edits>0:
+                    fuzzy.append((-count,name_id))
+            fuzzy.sort()
+            for count, name_id in fuzzy[:SEARCH_MAX_FUZZY]:
+                name = self.names[name_id]
+                edits = get_substring_distance(query,name,max_edits)
+                if edits<=max_edits:
+                    ranks[name] = self.RANK_FUZZY+edits
+            for name_id in self.get_prefix_ids(query):
+                name = self.names[name_id]
+                if name in allowed: candidates.append(name)
+
+        for name in candidates:
+            if name==query:
+                rank = self.RANK_EXACT
+            elif name.startswith(query):
+                rank = self.RANK_PREFIX
+            elif (' '+name).find(' '+query)!=-1:
+                rank = self.RANK_WORD_PREFIX
+            else:
+                rank = self.RANK_SUBSTRING
+            ranks[name] = rank
+
+        if len(ranks)==0: return []
+        for n in range(len(name_choices)):
+            if name_choices[n] in ranks: order[name_choices[n]] = n
+        return sorted(((rank,name) for name, rank in ranks.items() if name in order), key=lambda x: (x[0],order[x[1]]))
+
+#-------------------------------------------------------------------------------
+# AuThumbnailCache class
+#-------------------------------------------------------------------------------
+
+class AuThumbnailCache:
+
+    # downsized images kept in memory (LRU, limited by decoded size in bytes)
+    # and optionally on disk, keyed by source path + mtime + size; the disk
+    # files of changed sources are never hit again, so they are the least
+    # recently used ones removed when the folder is over max_disk_bytes
+
+    def __init__(self, thumbs_folder, thumb_size, max_bytes, use_disk=True, max_disk_bytes=0):
+        self.thumbs_folder = thumbs_folder
+        self.thumb_size = thumb_size
+        self.max_bytes = max_bytes
+        self.use_disk = use_disk
+        self.max_disk_bytes = max_disk_bytes
+        self.images = OrderedDict()
+        self.num_bytes = 0
+        self.disk_bytes = None # unknown until the first save scans the folder
+        self.lock = threading.Lock()
+        self.disk_lock = threading.Lock()
+        if self.use_disk:
+            make_sure_dir_exists(self.thumbs_folder)
+
+    def get_key(self, image_fnam):
+        st = stat(image_fnam)
+        return (image_fnam, st.st_mtime_ns, st.st_size)
+
+    def get_disk_fnam(self, key):
+        key_str = key[0]+'|'+str(key[1])+'|'+str(key[2])+'|'+str(self.thumb_size)
+        return path.join(self.thumbs_folder,hashlib.sha1(key_str.encode('utf-8')).hexdigest()+'.jpg')
+
+    def make_thumbnail(self, image_fnam):
+        stats.count('image_decodes')
+        img = Image.open(image_fnam)
+        img.draft('RGB',(self.thumb_size,self.thumb_size))
+        img.thumbnail((self.thumb_size,self.thumb_size))
+        if img.mode!='RGB':
+            img = img.convert('RGB')
+        return img
+
+    def get(self, image_fnam):
+        key = self.get_key(image_fnam)
+        with self.lock:
+            img = self.images.get(key,None)
+            if img!=None:
+                self.images.move_to_end(key)
+                stats.count('thumbnail_hits')
+                return img
+        stats.count('thumbnail_misses')
+
+        img = None
+        disk_fnam = None
+        if self.use_disk:
+            disk_fnam = self.get_disk_fnam(key)
+            if path.exists(disk_fnam):
+                try:
+                    img = Image.open(disk_fnam)
+                    img.load()
+                    utime(disk_fnam) # mtime = last use
+                    stats.count('thumbnail_disk_hits')
+                except:
+                    img = None
+        if img==None:
+            img = self.make_thumbnail(image_fnam)
+            if disk_fnam!=None:
+                try:
+                    with open_atomic(disk_fnam,'wb') as f:
+                        img.save(f,'JPEG',quality=90)
+                    self.add_disk_bytes(stat(disk_fnam).st_size)
+                except Exception as e:
+                    print('warning: could not save thumbnail ',disk_fnam,e)
+        self.put(key,img)
+        return img
+
+    def add_disk_bytes(self, num_bytes):
+        # the folder is scanned on the first save, not on start, and again
+        # when over budget; on a thread, so loading doesn't wait for it
+        if self.max_disk_bytes<=0: return
+        with self.lock:
+            if self.disk_bytes==None:
+                self.disk_bytes = 0
+            else:
+                self.disk_bytes += num_bytes
+                if self.disk_bytes<=self.max_disk_bytes: return
+        if self.disk_lock.locked(): return
+        threading.Thread(target=self.prune_disk,args=(False,),daemon=True).start()
+
+    def prune_disk(self, blocking=True):
+        # removes the least recently used files until the folder is down to
+        # 90% of max_disk_bytes, so it isn't scanned again on the next save
+        if not self.disk_lock.acquire(blocking=blocking): return
+        try:
+            entries = []
+            total = 0
+            with scandir(self.thumbs_folder) as it:
+                for entry in it:
+                    if (not entry.name.endswith('.jpg')) or (not entry.is_file()): continue
+                    st = entry.stat()
+                    entries.append((st.st_mtime,st.st_size,entry.path))
+                    total += st.st_size
+            if (self.max_disk_bytes>0) and (total>self.max_disk_bytes):
+                entries.sort()
+                for mtime, size, file_name in entries:
+                    if total<=self.max_disk_bytes*0.9: break
+                    try:
+                        remove(file_name)
+                        total -= size
+                        stats.count('thumbnail_disk_removes')
+                    except OSError:
+                        pass
+            with self.lock:
+                self.disk_bytes = total
+        finally:
+            self.disk_lock.release()
+
+    def put(self, key, img):
+        img_bytes = img.width*img.height*len(img.getbands())
+        with self.lock:
+            old_img = self.images.pop(key,None)
+            if old_img!=None:
+                self.num_bytes -= old_img.width*old_img.height*len(old_img.getbands())
+            self.images[key] = img
+            self.num_bytes += img_bytes
+            while (self.num_bytes>self.max_bytes) and (len(self.images)>1):
+                _, old_img = self.images.popitem(last=False)
+                self.num_bytes -= old_img.width*old_img.height*len(old_img.getbands())
+
+    def clear(self):
+        with self.lock:
+            self.images.clear()
+            self.num_bytes = 0
+
+#-------------------------------------------------------------------------------
+# AuPrefetcher class
+#-------------------------------------------------------------------------------
+
+class AuPrefetcher:
+
+    # loads images of the names around the selected one into the thumbnail
+    # cache, so stepping with prev/next is served from memory; each session
+    # has its own pending job, so sessions don't cancel each other's
+
+    def __init__(self, engine, num_names, num_workers):
+        self.engine = engine
+        self.num_names = num_names
+        self.executor = ThreadPoolExecutor(max_workers=num_workers,thread_name_prefix='artist_util_prefetch')
+        self.jobs = WeakKeyDictionary() # session -> {'cancelled', 'futures'}
+        self.lock = threading.Lock()
+
+    def cancel(self, session):
+        with self.lock:
+            job = self.jobs.pop(session,None)
+        if job==None: return
+        job['cancelled'] = True
+        for future in job['futures']:
+            future.cancel()
+
+    def prefetch(self, session, name_choices, name_index, folders):
+        self.cancel(session)
+        if name_index==-1: return
+        folders = [x for x in folders if x!='']
+        if len(folders)==0: return
+        # nearest names first, next before prev
+        names = []
+        for n in range(1,self.num_names+1):
+            for index in [name_index+n, name_index-n]:
+                if (index>=0) and (index<len(name_choices)):
+                    names.append(name_choices[index])
+        job = {'cancelled':False, 'futures':[]}
+        with self.lock:
+            self.jobs[session] = job
+            for name in names:
+                for folder in folders:
+                    job['futures'].append(self.executor.submit(self.load_image,job,folder,name))
+
+    def load_image(self, job, folder, name):
+        if job['cancelled']: return
+        self.engine.load_image(folder, name)
+
+#-------------------------------------------------------------------------------
+# AuCoverage class
+#-------------------------------------------------------------------------------
+
+class AuCoverage:
+
+    # names x image subfolders -> position of the name's image in the
+    # folder's sorted file list, -1 if missing; one int array per folder,
+    # rebuilt only when that folder's file list or the roster changes
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.lock = threading.Lock()
+        self.names = None
+        self.name_rows = {}
+        self.folder_lists = {} # folder -> file list the column was built from
+        self.columns = {}
+
+    @timed('coverage.update')
+    def update(self):
+        # returns the folders whose columns were rebuilt
+        engine = self.engine
+        result = []
+        with self.lock:
+            if not self.names is engine.all_names_list:
+                self.names = engine.all_names_list
+                self.name_rows = {self.names[n]:n for n in range(len(self.names))}
+                self.folder_lists = {}
+            folders = engine.image_subfolder_choices
+            for folder in list(self.columns.keys()):
+                if not folder in folders:
+                    del self.columns[folder]
+                    del self.folder_lists[folder]
+            for folder in folders:
+                with engine.folder_lock:
+                    image_files = engine.get_image_files(folder)
+                    if image_files==None: continue
+                    if self.folder_lists.get(folder,None) is image_files: continue
+                    column = array('i',[-1])*len(self.names)
+                    for name, file_name in engine.image_index.get(folder,{}).items():
+                        row = self.name_rows.get(name,None)
+                        if row!=None:
+                            column[row] = bisect_left(image_files,file_name)
+                self.columns[folder] = column
+                self.folder_lists[folder] = image_files
+                result.append(folder)
+        return result
+
+    def get_missing_folders(self, name, folders):
+        # which of folders have no image of name
+        row = self.name_rows.get(name,None)
+        return [x for x in folders if (x in self.columns) and ((row==None) or (self.columns[x][row]<0))]
+
+    def get_rows(self, names):
+        return [self.name_rows[x] for x in names if x in self.name_rows]
+
+    def get_folder_counts(self, names, folders):
+        # folder -> how many of names have an image in it
+        rows = self.get_rows(names)
+        result = {}
+        for folder in folders:
+            column = self.columns.get(folder,None)
+            result[folder] = 0 if column==None else sum(1 for row in rows if column[row]>=0)
+        return result
+
+    def get_missing_names(self, names, folders, missing_all=False):
+        # names missing an image in any of folders, or in all of them
+        columns = [self.columns[x] for x in folders if x in self.columns]
+        result = []
+        for name in names:
+            row = self.name_rows.get(name,None)
+            if row==None:
+                result.append(name)
+                continue
+            if missing_all:
+                missing = all(column[row]<0 for column in columns)
+            else:
+                missing = any(column[row]<0 for column in columns)
+            if missing:
+                result.append(name)
+        return result
+
+#-------------------------------------------------------------------------------
+# AuSession class
+#-------------------------------------------------------------------------------
+
+class AuSession:
+
+    # one user's selected list, name and search; names, tags and images are
+    # in the engine and shared by all sessions, name_choices is this
+    # session's own copy of the selected list (sorted, like all_names_list)
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.selected_list = ''
+        self.selected_list_index = -1
+        self.name_choices = []
+        self.selected_name = ''
+        self.selected_name_index = -1
+        self.default_name_indexes = {}
+        self.search_text = ''
+        self.search_list = ''
+        self.search_hits = []
+        self.search_num_exact = 0 # search_hits before the fuzzy ones
+        self.name_filter = ''
+        self.filtered_names = None # name_choices containing name_filter, made on use
+
+    def __deepcopy__(self, memo):
+        # gr.State copies its value for each browser session, the copies
+        # share the engine
+        session = copy(self)
+        session.default_name_indexes = self.default_name_indexes.copy()
+        return session
+
+    @timed('engine.select_list')
+    def select_list(self, item):
+        found_index = get_list_index(self.engine.list_choices, item)
+        if found_index==-1:
+            self.selected_list = ''
+            self.selected_list_index = -1
+            self.name_choices = []
+            self.selected_name = ''
+            self.selected_name_index = -1
+            return
+
+        self.selected_list = self.engine.list_choices[found_index]
+        self.selected_list_index = found_index
+
+        self.search_text = ''
+        self.search_hits = []
+        self.search_num_exact = 0
+
+        self.name_choices = self.engine.get_list_names(self.selected_list)
+        self.filtered_names = None
+        self.select_name(None)
+
+    def select_name(self, item):
+        found_index = get_list_index(self.name_choices, item, is_list_sorted=True)
+        if found_index==-1:
+            self.selected_name = ''
+            self.selected_name_index = -1
+            return
+        self.selected_name = self.name_choices[found_index]
+        self.selected_name_index = found_index
+        if self.selected_list_index!=-1:
+            self.default_name_indexes[self.selected_list] = found_index
+
+    def get_default_name(self):
+        if self.selected_list_index==-1:
+            return ''
+        index = self.default_name_indexes.get(self.selected_list,-1)
+        if index==-1:
+            if len(self.name_choices)>0: index = 0
+        if (index<0) or (index>=len(self.name_choices)):
+            default_name = ''
+        else:
+            default_name=self.name_choices[index]
+        return default_name
+
+    def set_name_filter(self, name_filter):
+        self.name_filter = name_filter.strip().lower()
+        self.filtered_names = None
+
+    def get_filtered_names(self):
+        if self.name_filter=='':
+            return self.name_choices
+        if self.filtered_names==None:
+            self.filtered_names = [x for x in self.name_choices if self.name_filter in x]
+        return self.filtered_names
+
+    def get_name_page(self, page_size):
+        # the page of filtered names that holds the selected name, or where
+        # it would be; returns (names, index of the first one, total)
+        names = self.get_filtered_names()
+        if page_size<=0:
+            return names, 0, len(names)
+        index = min(bisect_left(names,self.selected_name),max(len(names)-1,0))
+        first = index-index%page_size
+        return names[first:first+page_size], first, len(names)
+
+    def get_next_name(self, step=1):
+        # the name step places after the selected one in the filtered names,
+        # None past either end
+        names = self.get_filtered_names()
+        index = bisect_left(names,self.selected_name)
+        if (index<len(names)) and (names[index]==self.selected_name):
+            index += step
+        elif step>0:
+            index += step-1
+        else:
+            index += step
+        if (index<0) or (index>=len(names)): return None
+        return names[index]
+
+    def refresh_selection(self):
+        # keeps the selected list and name after the engine's lists changed,
+        # or falls back to the defaults if they are gone
+        selected_name = self.selected_name
+        if self.selected_list in self.engine.list_choices:
+            self.select_list(self.selected_list)
+        else:
+            self.select_list(self.engine.get_default_list())
+        if selected_name in self.name_choices:
+            self.select_name(selected_name)
+        else:
+            self.select_name(self.get_default_name())
+
+    @timed('engine.find_names')
+    def find_names(self, search_text, fuzzy=True):
+        # all matches in the current list, best first; without fuzzy only the
+        # names containing the text; the last result is kept so find next can
+        # step through it
+        search_text = search_text.strip().lower()
+        if search_text=='': return []
+        if (search_text!=self.search_text) or (self.search_list!=self.selected_list):
+            results = self.engine.get_search_index().search(search_text,self.name_choices)
+            self.search_hits = [x[1] for x in results]
+            self.search_num_exact = sum(1 for x in results if x[0]<AuSearchIndex.RANK_FUZZY)
+            self.search_text = search_text
+            self.search_list = self.selected_list
+        return self.search_hits if fuzzy else self.search_hits[:self.search_num_exact]
+
+    def find_next_name(self, search_text, step=1):
+        hits = self.find_names(search_text)
+        if len(hits)==0: return None
+        if not self.selected_name in hits:
+            return hits[0]
+        index = hits.index(self.selected_name)+step
+        if (index<0) or (index>=len(hits)): return None
+        return hits[index]
+
+    def prefetch_images(self, folders):
+        # the neighbours prev/next step to, in the filtered names
+        names = self.get_filtered_names()
+        self.engine.prefetch_images(self, names, get_list_index(names, self.selected_name, is_list_sorted=True), folders)
+
+    def cancel_prefetch(self):
+        self.engine.cancel_prefetch(self)
+
+#-------------------------------------------------------------------------------
+# AuEngine class
+#-------------------------------------------------------------------------------
+
+class AuEngine:
+
+    SPECIAL_ALL = '- All -'
+    SPECIAL_NOTAG = '- Uncategorized -'
+
+    def __init__(self, data_folder, load_assorted=False):
+
+        self.data_folder = data_folder
+        self.load_assorted = load_assorted
+        make_sure_dir_exists(self.data_folder)
+        self.images_folder = path.join(self.data_folder,'images','')
+        make_sure_dir_exists(self.images_folder)
+        self.tags_folder = path.join(self.data_folder,'tags','')
+        make_sure_dir_exists(self.tags_folder)
+        self.assorted_folder = path.join(self.data_folder,'assorted','')
+        make_sure_dir_exists(self.assorted_folder)
+        self.thumbs_folder = path.join(self.data_folder,'thumbnails','')
+
+        if THUMBNAIL_SIZE>0:
+            self.thumbnails = AuThumbnailCache(self.thumbs_folder,THUMBNAIL_SIZE,THUMBNAIL_CACHE_MB*1024*1024,THUMBNAIL_DISK_CACHE,
+                THUMBNAIL_DISK_CACHE_MB*1024*1024)
+        else:
+            self.thumbnails = None
+
+        if LOAD_WORKERS>1:
+            self.load_executor = ThreadPoolExecutor(max_workers=LOAD_WORKERS,thread_name_prefix='artist_util_load')
+        else:
+            self.load_executor = None
+
+        # prefetched images are only kept if there is a thumbnail cache
+        if (PREFETCH_NAMES>0) and (self.thumbnails!=None):
+            self.prefetcher = AuPrefetcher(self,PREFETCH_NAMES,PREFETCH_WORKERS)
+        else:
+            self.prefetcher = None
+
+        # image folder listings are loaded on first use and rescanned when
+        # the folder's mtime changes, see get_image_files
+        with stats.timer('engine.scan_folders'):
+            self.image_subfolder_choices = get_folder_list(self.images_folder)
+            self.image_subfolder_choices.sort()
+        self.folder_mtimes = {}
+        self.folder_checked = {}
+        self.folder_lock = threading.RLock()
+        self.image_files = {}
+        self.assorted_images = []
+
+        with stats.timer('engine.load_data'):
+            if USE_CATALOG==True:
+                self.catalog = AuCatalog(path.join(self.data_folder,'catalog.db'))
+                self.load_catalog_data()
+            else:
+                self.catalog = None
+                self.load_text_data()
+
+        with stats.timer('engine.build_index'):
+            self.build_tag_index()
+            self.build_image_index()
+
+        # changed tags are written by flush_tags, TAG_SAVE_DELAY after the
+        # last change, see set_name_tags
+        self.tag_lock = threading.RLock()
+        self.dirty_tags = set()
+        self.save_timer = None
+
+        self.list_choices = [self.SPECIAL_ALL, self.SPECIAL_NOTAG]+ self.tag_choices
+
+        # updated on use, see AuCoverage
+        self.coverage = AuCoverage(self)
+
+        # built on first search, see get_search_index
+        self.search_index = None
+
+    def load_text_data(self):
+        self.tag_choices = get_file_list(self.tags_folder,ext='txt',remove_ext=True)
+        self.tag_choices.sort()
+
+        self.tag_data = {}
+        for tag_name in self.tag_choices:
+            self.tag_data[tag_name]=load_string_list(path.join(self.tags_folder,tag_name+'.txt'),process=True)
+
+        self.template_choices = load_string_list(path.join(self.data_folder,'templates.txt'),process=False)
+
+        self.all_names_list = load_string_list(path.join(self.data_folder,'names.txt'),process=True)
+
+    def load_catalog_data(self):
+        # the first run imports the text files; later, tags added as new
+        # .txt files in the tags folder are imported on startup
+        if self.catalog.is_empty():
+            num_names, num_tags = self.catalog.import_text(self.data_folder)
+            print('Artist-Util: imported '+str(num_names)+' names and '+str(num_tags)+' tags into '+self.catalog.db_fnam)
+        catalog_tags = set(self.catalog.get_tags())
+        for tag_name in get_file_list(self.tags_folder,ext='txt',remove_ext=True):
+            if not tag_name in catalog_tags:
+                self.catalog.add_tag(tag_name,load_string_list(path.join(self.tags_folder,tag_name+'.txt'),process=True))
+
+        self.tag_data = self.catalog.get_tag_data()
+        self.tag_choices = sorted(self.tag_data.keys())
+        self.template_choices = [x for x in self.catalog.get_string_list('templates') if x!='']
+        self.all_names_list = self.catalog.get_names()
+
+    @timed('engine.get_list_names')
+    def get_list_names(self, item):
+        # a new list for each call, sessions keep it as their name_choices
+        if item==self.SPECIAL_ALL:
+            return self.all_names_list.copy()
+        if item==self.SPECIAL_NOTAG:
+            return self.get_uncategorized_names()
+        with self.tag_lock:
+            tag_set = self.tag_sets.get(item,None)
+            if tag_set==None: return []
+            # all_names_list is sorted and unique, so this keeps its order
+            return sorted(tag_set & self.all_names_set)
+
+    def get_default_template(self):
+        if len(self.template_choices)>0:
+            default_template = self.template_choices[0]
+        else:
+            default_template = ''
+        return default_template
+
+    def get_default_list(self):
+        if len(self.list_choices)>0:
+            default_list = self.list_choices[0]
+        else:
+            default_list = ''
+        return default_list
+
+    def build_tag_index(self):
+        # tag_data keeps the sorted lists as stored on disk, the index below
+        # answers membership queries: tag -> set of names, name -> tag bitmask
+        # (bit n is set if the name has tag_choices[n]); built aside and then
+        # swapped in, so sessions reading it never see it half built
+        tag_bits = {}
+        tag_sets = {}
+        name_tag_masks = {}
+        for n in range(len(self.tag_choices)):
+            tag_name = self.tag_choices[n]
+            bit = 1<<n
+            tag_set = set(self.tag_data[tag_name])
+            tag_bits[tag_name] = bit
+            tag_sets[tag_name] = tag_set
+            for name in tag_set:
+                name_tag_masks[name] = name_tag_masks.get(name,0) | bit
+        self.all_names_set = set(self.all_names_list)
+        self.tag_bits = tag_bits
+        self.tag_sets = tag_sets
+        self.name_tag_masks = name_tag_masks
+
+    def get_tags_mask(self, tags):
+        mask = 0
+        for tag_name in tags:
+            mask |= self.tag_bits.get(tag_name,0)
+        return mask
+
+    def get_mask_tags(self, mask):
+        result = []
+        while mask:
+            low_bit = mask & -mask
+            result.append(self.tag_choices[low_bit.bit_length()-1])
+            mask ^= low_bit
+        return result
+
+    def compile_tag_filter(self, expression):
+        # 'tag1 and (tag2 or not tag3)', also with & | ! and "quoted tags"
+        # for tag names with spaces or operators; returns a function that
+        # picks the matching names out of a set of names using set
+        # operations on tag_sets, None for an empty expression; tags are
+        # matched as stored, or else ignoring case; raises ValueError for
+        # unknown tags or bad syntax
+        tokens = re.findall(r'"[^"]*"?|\(|\)|&|\||!|[^\s()&|!"]+',expression)
+        tokens = [{'and':'&','or':'|','not':'!'}.get(x.lower(),x) for x in tokens]
+        if len(tokens)==0: return None
+        with self.tag_lock:
+            tag_sets = self.tag_sets
+        lower_tags = {}
+        for tag_name in tag_sets:
+            lower_tags.setdefault(tag_name.lower(),tag_name)
+        pos = 0
+
+        def peek():
+            return tokens[pos] if pos<len(tokens) else None
+
+        def union(left, right):
+            return lambda names: left(names)|right(names)
+
+        def intersection(left, right):
+            return lambda names: left(names)&right(names)
+
+        def difference(right):
+            return lambda names: names-right(names)
+
+        def tag_filter(tag_set):
+            return lambda names: names&tag_set
+
+        def parse_or():
+            nonlocal pos
+            fn = parse_and()
+            while peek()=='|':
+                pos += 1
+                fn = union(fn,parse_and())
+            return fn
+
+        def parse_and():
+            nonlocal pos
+            fn = parse_not()
+            while peek()=='&':
+                pos += 1
+                fn = intersection(fn,parse_not())
+            return fn
+
+        def parse_not():
+            nonlocal pos
+            token = peek()
+            if token=='!':
+                pos += 1
+                return difference(parse_not())
+            if token=='(':
+                pos += 1
+                fn = parse_or()
+                if peek()!=')': raise ValueError('missing )')
+                pos += 1
+                return fn
+            if (token==None) or (token in [')','&','|']):
+                raise ValueError('unexpected '+str(token))
+            if token.startswith('"'):
+                if (len(token)<2) or (not token.endswith('"')): raise ValueError('missing "')
+                token = token[1:-1]
+            tag_name = token if token in tag_sets else lower_tags.get(token.lower(),None)
+            if tag_name==None: raise ValueError('unknown tag "'+token+'"')
+            pos += 1
+            return tag_filter(tag_sets[tag_name])
+
+        fn = parse_or()
+        if pos<len(tokens): raise ValueError('unexpected '+tokens[pos])
+        return fn
+
+    def get_name_tags(self, name):
+        if name=='': return []
+        return self.get_mask_tags(self.name_tag_masks.get(name,0))
+
+    @timed('engine.set_name_tags')
+    def set_name_tags(self, name, new_tags):
+        with self.tag_lock:
+            old_mask = self.name_tag_masks.get(name,0)
+            new_mask = self.get_tags_mask(new_tags)
+            changed_mask = old_mask ^ new_mask
+            if changed_mask==0: return
+            for tag_name in self.get_mask_tags(changed_mask):
+                tag_data = self.tag_data[tag_name]
+                tag_set = self.tag_sets[tag_name]
+                if new_mask & self.tag_bits[tag_name]:
+                    insort(tag_data,name)
+                    tag_set.add(name)
+                else:
+                    del tag_data[bisect_left(tag_data,name)]
+                    tag_set.discard(name)
+                self.dirty_tags.add(tag_name)
+            if new_mask==0:
+                self.name_tag_masks.pop(name,None)
+            else:
+                self.name_tag_masks[name] = new_mask
+        self.schedule_save()
+
+    def schedule_save(self):
+        if TAG_SAVE_DELAY<=0:
+            self.flush_tags()
+            return
+        with self.tag_lock:
+            if self.save_timer!=None:
+                self.save_timer.cancel()
+            self.save_timer = threading.Timer(TAG_SAVE_DELAY,self.flush_tags)
+            self.save_timer.daemon = True
+            self.save_timer.start()
+
+    @timed('engine.flush_tags')
+    def flush_tags(self):
+        with self.tag_lock:
+            if self.save_timer!=None:
+                self.save_timer.cancel()
+                self.save_timer = None
+            dirty_tags = sorted(self.dirty_tags)
+            self.dirty_tags = set()
+            if (self.catalog!=None) and (len(dirty_tags)>0):
+                try:
+                    self.catalog.save_tags({x:self.tag_data[x] for x in dirty_tags})
+                except Exception as e:
+                    self.dirty_tags.update(dirty_tags)
+                    print('warning: could not save tags to ',self.catalog.db_fnam,e)
+                return
+            for tag_name in dirty_tags:
+                tag_fnam = path.join(self.tags_folder,tag_name+'.txt')
+                try:
+                    save_string_list_atomic(self.tag_data[tag_name],tag_fnam)
+                except Exception as e:
+                    self.dirty_tags.add(tag_name)
+                    print('warning: could not save ',tag_fnam,e)
+
+    @timed('engine.bulk_tag_names')
+    def bulk_tag_names(self, names, add_tags, remove_tags):
+        # adds then removes tags for all names at once, each changed tag file
+        # is written once; returns {tag_name: number of names changed}
+        names = set(x.strip().lower() for x in names)
+        names.discard('')
+        result = {}
+        with self.tag_lock:
+            for tag_name, add in [(x,True) for x in add_tags]+[(x,False) for x in remove_tags]:
+                tag_set = self.tag_sets.get(tag_name,None)
+                if tag_set==None: continue
+                bit = self.tag_bits[tag_name]
+                if add:
+                    changed = names-tag_set
+                    tag_set |= changed
+                    for name in changed:
+                        self.name_tag_masks[name] = self.name_tag_masks.get(name,0) | bit
+                else:
+                    changed = names & tag_set
+                    tag_set -= changed
+                    for name in changed:
+                        mask = self.name_tag_masks[name] & ~bit
+                        if mask==0:
+                            del self.name_tag_masks[name]
+                        else:
+                            self.name_tag_masks[name] = mask
+                if len(changed)==0: continue
+                self.tag_data[tag_name][:] = sorted(tag_set)
+                self.dirty_tags.add(tag_name)
+                result[tag_name] = result.get(tag_name,0)+len(changed)
+            self.flush_tags()
+        return result
+
+    def get_search_index(self):
+        # built on first search and shared by all sessions
+        search_index = self.search_index
+        if search_index==None:
+            search_index = AuSearchIndex(self.all_names_list)
+            self.search_index = search_index
+        return search_index
+
+    def get_uncategorized_names(self):
+        masks = self.name_tag_masks
+        return [name for name in self.all_names_list if not name in masks]
+
+    def build_image_index(self):
+        # a file matches a name if the lowercased file name contains the name;
+        # every roster name is matched against every file once, keeping the
+        # first matching file per image subfolder (files are sorted) and all
+        # matching assorted files in listing order
+        self.name_matcher = AuNameMatcher(self.all_names_list)
+        self.image_index = {}
+        self.assorted_index = {}
+
+    def index_first_files(self, file_list, first_files=None):
+        if first_files==None: first_files = {}
+        for file_name in file_list:
+            for name in self.name_matcher.find_all(file_name.lower()):
+                old_file_name = first_files.get(name,None)
+                if (old_file_name==None) or (file_name<old_file_name):
+                    first_files[name] = file_name
+        return first_files
+
+    def index_all_files(self, file_list, name_files=None):
+        if name_files==None: name_files = {}
+        for file_name in file_list:
+            for name in self.name_matcher.find_all(file_name.lower()):
+                name_files.setdefault(name,[]).append(file_name)
+        return name_files
+
+    def get_changed_mtime(self, dir_name):
+        # returns the folder's new mtime if it changed since the last scan,
+        # None if unchanged or checked less than IMAGE_RESCAN_INTERVAL ago
+        now = time.monotonic()
+        last_checked = self.folder_checked.get(dir_name,None)
+        if (last_checked!=None) and (now-last_checked<IMAGE_RESCAN_INTERVAL):
+            return None
+        self.folder_checked[dir_name] = now
+        try:
+            mtime = stat(dir_name).st_mtime_ns
+        except OSError:
+            mtime = -1
+        if (dir_name in self.folder_mtimes) and (self.folder_mtimes[dir_name]==mtime):
+            return None
+        self.folder_mtimes[dir_name] = mtime
+        return mtime
+
+    @timed('engine.get_image_files')
+    def get_image_files(self, image_sub_folder):
+        if not image_sub_folder in self.image_subfolder_choices: return None
+        dir_name = path.join(self.images_folder,image_sub_folder,'')
+        with self.folder_lock:
+            self.update_image_files(image_sub_folder, dir_name)
+        return self.image_files.get(image_sub_folder,None)
+
+    def update_image_files(self, image_sub_folder, dir_name):
+        if self.get_changed_mtime(dir_name)!=None:
+            file_list = get_file_list(dir_name)
+            file_list.sort()
+            old_file_list = self.image_files.get(image_sub_folder,None)
+            if old_file_list==None:
+                first_files = self.index_first_files(file_list)
+            else:
+                old_files = set(old_file_list)
+                new_files = set(file_list)
+                if old_files<=new_files:
+                    # only additions, index just the new files
+                    first_files = self.index_first_files(new_files-old_files,self.image_index[image_sub_folder])
+                else:
+                    first_files = self.index_first_files(file_list)
+            self.image_index[image_sub_folder] = first_files
+            self.image_files[image_sub_folder] = file_list
+
+    def get_assorted_files(self):
+        if self.load_assorted==False: return []
+        with self.folder_lock:
+            self.update_assorted_files()
+        return self.assorted_images
+
+    def update_assorted_files(self):
+        if self.get_changed_mtime(self.assorted_folder)!=None:
+            file_list = get_file_list(self.assorted_folder)
+            old_files = set(self.assorted_images)
+            if old_files<=set(file_list):
+                added = [x for x in file_list if not x in old_files]
+                self.index_all_files(added,self.assorted_index)
+                self.assorted_images = self.assorted_images+added
+            else:
+                self.assorted_index = self.index_all_files(file_list)
+                self.assorted_images = file_list
+
+    @timed('engine.reload_names')
+    def reload_names(self):
+        # names.txt changed; the image lists are kept and only re-matched
+        # against the new roster; returns True if anything changed
+        if self.catalog!=None: return False
+        names = load_string_list(path.join(self.data_folder,'names.txt'),process=True)
+        if names==self.all_names_list: return False
+        name_matcher = AuNameMatcher(names)
+        with self.folder_lock:
+            self.all_names_list = names
+            self.all_names_set = set(names)
+            self.name_matcher = name_matcher
+            self.image_index = {x:self.index_first_files(y) for x,y in self.image_files.items()}
+            self.assorted_index = self.index_all_files(self.assorted_images)
+        self.search_index = None
+        return True
+
+    @timed('engine.reload_tags')
+    def reload_tags(self, tag_names):
+        # tag files changed, were added or removed; tags with unsaved changes
+        # keep the in-memory version; returns True if anything changed
+        if self.catalog!=None: return False
+        changed = False
+        with self.tag_lock:
+            for tag_name in tag_names:
+                if tag_name in self.dirty_tags: continue
+                tag_fnam = path.join(self.tags_folder,tag_name+'.txt')
+                if path.exists(tag_fnam):
+                    tag_data = load_string_list(tag_fnam,process=True)
+                    if self.tag_data.get(tag_name,None)==tag_data: continue
+                    self.tag_data[tag_name] = tag_data
+                elif tag_name in self.tag_data:
+                    del self.tag_data[tag_name]
+                else:
+                    continue
+                changed = True
+            if changed:
+                self.tag_choices = sorted(self.tag_data.keys())
+                self.build_tag_index()
+                self.list_choices = [self.SPECIAL_ALL, self.SPECIAL_NOTAG]+ self.tag_choices
+        return changed
+
+    def reload_templates(self):
+        if self.catalog!=None: return False
+        template_choices = load_string_list(path.join(self.data_folder,'templates.txt'),process=False)
+        if template_choices==self.template_choices: return False
+        self.template_choices = template_choices
+        return True
+
+    @timed('engine.reload_image_folders')
+    def reload_image_folders(self):
+        # picks up added and removed subfolders of images/; returns True if
+        # they changed
+        folders = get_folder_list(self.images_folder)
+        folders.sort()
+        with self.folder_lock:
+            changed = folders!=self.image_subfolder_choices
+            if changed:
+                for folder in set(self.image_subfolder_choices)-set(folders):
+                    self.image_files.pop(folder,None)
+                    self.image_index.pop(folder,None)
+                    self.folder_mtimes.pop(path.join(self.images_folder,folder,''),None)
+                self.image_subfolder_choices = folders
+        return changed
+
+    def rescan_image_folder(self, image_sub_folder):
+        # the folder's mtime changed, rescans it if it is loaded
+        with self.folder_lock:
+            if image_sub_folder in self.image_files:
+                self.update_image_files(image_sub_folder,path.join(self.images_folder,image_sub_folder,''))
+
+    @timed('engine.update_image_file_names')
+    def update_image_file_names(self, image_sub_folder, file_names):
+        # adds or removes just these files of a loaded folder, as they are
+        # now on disk, without listing the folder; the file list is replaced,
+        # not changed in place, so users of it can tell it changed; returns
+        # True if anything changed
+        dir_name = path.join(self.images_folder,image_sub_folder,'')
+        with self.folder_lock:
+            old_file_list = self.image_files.get(image_sub_folder,None)
+            if old_file_list==None: return False
+            file_list = old_file_list
+            first_files = self.image_index[image_sub_folder]
+            for file_name in set(file_names):
+                index = bisect_left(file_list,file_name)
+                listed = (index<len(file_list)) and (file_list[index]==file_name)
+                if path.isfile(path.join(dir_name,file_name)):
+                    if listed: continue
+                    if file_list is old_file_list: file_list = file_list.copy()
+                    file_list.insert(index,file_name)
+                    self.index_first_files([file_name],first_files)
+                else:
+                    if not listed: continue
+                    if file_list is old_file_list: file_list = file_list.copy()
+                    del file_list[index]
+                    for name in self.name_matcher.find_all(file_name.lower()):
+                        if first_files.get(name,None)!=file_name: continue
+                        # the next file containing the name is its first now
+                        next_files = (x for x in file_list[index:] if name in x.lower())
+                        next_file = next(next_files,None)
+                        if next_file==None:
+                            del first_files[name]
+                        else:
+                            first_files[name] = next_file
+            if file_list is old_file_list: return False
+            self.image_files[image_sub_folder] = file_list
+            # the changes are applied, so the next mtime check doesn't rescan
+            try:
+                self.folder_mtimes[dir_name] = stat(dir_name).st_mtime_ns
+            except OSError:
+                pass
+        return True
+
+    @timed('engine.load_image')
+    def load_image(self, image_sub_folder, name):
+        file_name = self.find_image_filename(image_sub_folder, name)
+        if file_name==None: return None
+        image_path = path.join(self.images_folder,image_sub_folder,'')
+        image_files = self.image_files.get(image_sub_folder,[])
+        name = name.strip().lower()
+        # if the first match can't be opened, try the files after it
+        for n in range(bisect_left(image_files,file_name),len(image_files)):
+            file_name = image_files[n]
+            if not name in file_name.lower(): continue
+            image_fnam = path.join(image_path,file_name)
+            try:
+                if self.thumbnails!=None:
+                    return self.thumbnails.get(image_fnam)
+                stats.count('image_decodes')
+                img = Image.open(image_fnam)
+                img.load()
+                return img
+            except:
+                print('warning: error loading ',image_fnam)
+        return None
+
+    def prefetch_images(self, session, names, index, folders):
+        if self.prefetcher!=None:
+            self.prefetcher.prefetch(session, names, index, folders)
+
+    def cancel_prefetch(self, session):
+        if self.prefetcher!=None:
+            self.prefetcher.cancel(session)
+
+    def save_last_folders(self,folders):
+        if self.catalog!=None:
+            self.catalog.set_string_list('last_folders',folders)
+            return
+        save_string_list(folders, path.join(self.data_folder,'last_folders.txt'),overwrite=True)
+
+    def load_last_folders(self, num_images):
+        if self.catalog!=None:
+            folders = self.catalog.get_string_list('last_folders')
+        else:
+            folders = load_string_list(path.join(self.data_folder,'last_folders.txt'),process=False,addempty=True)
+        num_folders = len(folders)
+        if (num_folders>0) and (num_folders<num_images):
+                folders = folders + ['']*(num_images-num_folders)
+        return folders
+
+    def load_assorted_image(self, file_name):
+        image_fnam = path.join(self.assorted_folder,file_name)
+        stats.count('image_decodes')
+        try:
+            img = Image.open(image_fnam)
+            img.load()
+        except:
+            img = None
+            print('warning: error loading ',image_fnam)
+        return img
+
+    def get_assorted_images(self, name):
+        tasks = [partial(self.load_assorted_image,file_name) for file_name in self.get_assorted_filenames(name)]
+        return [img for img in self.run_tasks(tasks) if img!=None]
+
+    @timed('engine.load_panel_images')
+    def load_panel_images(self, image_sub_folders, name, add_assorted=False):
+        # folder images and assorted images are decoded together on the load
+        # pool; folder images keep the order of image_sub_folders
+        tasks = [partial(self.load_image,folder,name) for folder in image_sub_folders]
+        if add_assorted:
+            for file_name in self.get_assorted_filenames(name):
+                tasks.append(partial(self.load_assorted_image,file_name))
+        results = self.run_tasks(tasks)
+        folder_images = results[:len(image_sub_folders)]
+        assorted_images = [img for img in results[len(image_sub_folders):] if img!=None]
+        return folder_images, assorted_images
+
+    def run_tasks(self, tasks):
+        if (self.load_executor==None) or (len(tasks)<2):
+            return [task() for task in tasks]
+        return list(self.load_executor.map(lambda task: task(), tasks))
+
+    def find_image_filename(self, image_sub_folder, name):
+        name = name.strip().lower()
+        if (name=='') or (image_sub_folder==''): return None
+        image_files = self.get_image_files(image_sub_folder)
+        if image_files==None: return None
+        if name in self.name_matcher.names:
+            return self.image_index[image_sub_folder].get(name,None)
+        # names outside the roster are not indexed
+        result = None
+        for file_name in image_files:
+            if name in file_name.lower():
+                result = file_name
+                break
+        return result
+
+    def get_assorted_filenames(self, name):
+        name = name.strip().lower()
+        if name=='':
+            return []
+        assorted_images = self.get_assorted_files()
+        if name in self.name_matcher.names:
+            return self.assorted_index.get(name,[]).copy()
+        result = []
+        for file_name in assorted_images:
+            if name in file_name.lower():
+                result.append(file_name)
+        return result
@@ -0,0 +1,410 @@
+# Artist-Util prompt and HTML export, used by the UI and the command line
+#
+# https://github.com/tkalayci71/artist-util
+
+from os import path, makedirs, stat, remove
+from itertools import chain
+from PIL import Image
+import random
+import re
+
+from lib_artist_util.engine import AuShardWriter, save_string_iter, open_atomic, map_processes, get_file_list
+from lib_artist_util.atlas import build_atlas
+
+#-------------------------------------------------------------------------------
+# Options
+#-------------------------------------------------------------------------------
+
+PROMPT_MAX_FILES = 100 # most files ("Files") the prompts can be split into, each is open while writing
+
+HTML_ADD_INDEX = False # True
+HTML_BORDER_STR = '0' # '1'
+HTML_WIDTH_STR = '128'
+HTML_HEIGHT_STR = '128'
+HTML_ADD_TAGS = True # False # True
+HTML_ADD_ASSORTED = False # True
+HTML_PAGE_SIZE = 0 # 500 # names per page, html_output.html becomes an index page, 0 = single page
+HTML_LAZY_LOADING = True # False # add loading="lazy" to image tags
+HTML_THUMBNAILS = False # True # link thumbnails made in html_assets/<HTML_THUMBNAIL_SIZE>/ instead of full size images
+HTML_THUMBNAIL_SIZE = 128
+HTML_THUMBNAIL_FORMAT = 'webp' # 'jpeg'
+HTML_ATLAS = False # True # pack the images of each page and folder into a few sprite sheets in html_assets/atlas/, see atlas.py
+
+#-------------------------------------------------------------------------------
+# Prompts
+#-------------------------------------------------------------------------------
+
+def apply_template(template_text, name, prompt_text):
+    text = template_text.replace('NAME',name).replace('PROMPT',prompt_text)
+    text = text.replace('NAME',name)
+    return text
+
+def get_prompt_names(au, names, skip_tags, counts, include_filter=None):
+    # skip and include tags are resolved with set operations on the tag
+    # index, then names are filtered in one pass keeping their order
+    skip_set = set()
+    for tag_name in skip_tags:
+        skip_set |= au.tag_sets.get(tag_name,set())
+    result = [name for name in names if not name in skip_set]
+    counts['skipped'] = len(names)-len(result)
+    counts['excluded'] = 0
+    if include_filter!=None:
+        include_set = include_filter(set(result))
+        num_names = len(result)
+        result = [name for name in result if name in include_set]
+        counts['excluded'] = num_names-len(result)
+    counts['names'] = len(result)
+    return result
+
+def iter_prompts(names, templates, prompts):
+    # name x template x prompt, name-major so each name's lines stay together
+    for name in names:
+        for template_text in templates:
+            for prompt_text in prompts:
+                yield apply_template(template_text,name,prompt_text)
+
+def iter_sampled(lines, sample_rate, seed):
+    # keeps each line with probability sample_rate, same seed = same lines
+    if sample_rate>=1:
+        yield from lines
+        return
+    rng = random.Random(seed)
+    for line in lines:
+        if rng.random()<sample_rate:
+            yield line
+
+def get_shard_file_names(base_path, num_shards):
+    if num_shards<=1: return [base_path]
+    root, ext = path.splitext(base_path)
+    width = len(str(num_shards))
+    return [root+'_'+str(n+1).zfill(width)+ext for n in range(num_shards)]
+
+def remove_old_shards(base_path, file_names):
+    # output_<n>.txt files of an earlier run with more files would look
+    # like part of this one, returns how many were removed
+    folder, file_name = path.split(base_path)
+    root, ext = path.splitext(file_name)
+    pattern = re.compile(re.escape(root)+r'_\d+'+re.escape(ext)+'$')
+    num_removed = 0
+    for file_name in get_file_list(folder):
+        full_path = path.join(folder,file_name)
+        if pattern.match(file_name) and (not full_path in file_names):
+            remove(full_path)
+            num_removed += 1
+    return num_removed
+
+def save_prompts(au, names, templates, prompts, skip_tags, base_path, num_shards=1, sample_rate=1.0, seed=0, include_filter=None):
+    # returns (counts, file names written)
+    counts = {}
+    file_names = get_shard_file_names(base_path,num_shards)
+    counts['removed'] = remove_old_shards(base_path,file_names)
+    writer = AuShardWriter(file_names)
+    try:
+        for line in iter_sampled(iter_prompts(get_prompt_names(au,names,skip_tags,counts,include_filter),templates,prompts),sample_rate,seed):
+            writer.write(line)
+    finally:
+        counts['lines'] = writer.close()
+    # files that got no lines this time are not written at all
+    for n in range(len(file_names)):
+        if (writer.counts[n]==0) and path.exists(file_names[n]):
+            remove(file_names[n])
+            counts['removed'] += 1
+    return counts, [file_names[n] for n in range(len(file_names)) if writer.counts[n]>0]
+
+def export_prompts(au, names, list_name, output_folder, template_text, prompt_text, skip_tags, include_text='', extra_templates=[], prompt_per_line=False, num_shards=1, sample_rate=1.0, seed=0):
+    #prompt_text = prompt_text.lower()
+    log = []
+    log.append('Template: "'+template_text+'"')
+    log.append('Prompt: "'+prompt_text+'"')
+    log.append('List: "'+list_name+'"')
+
+    try:
+        include_filter = au.compile_tag_filter(include_text)
+    except ValueError as e:
+        log.append('Error: include tags "'+include_text+'": '+str(e))
+        return '\n'.join(log)
+
+    # cleared number fields in the UI send None
+    values = []
+    for label, value, convert in [('files',num_shards,int),('sample rate',sample_rate,float),('seed',seed,int)]:
+        try:
+            values.append(convert(float(value)))
+        except (TypeError, ValueError, OverflowError):
+            log.append('Error: '+label+' must be a number, not '+str(value))
+    if len(values)<3:
+        return '\n'.join(log)
+    num_shards = max(1,values[0])
+    if num_shards>PROMPT_MAX_FILES:
+        log.append('Files: '+str(num_shards)+' is more than PROMPT_MAX_FILES, using '+str(PROMPT_MAX_FILES))
+        num_shards = PROMPT_MAX_FILES
+    sample_rate = min(1.0,max(0.0,values[1]))
+    seed = values[2]
+
+    templates = [template_text]+[x for x in extra_templates if x!=template_text]
+    if prompt_per_line:
+        prompts = [x.strip() for x in prompt_text.split('\n') if x.strip()!='']
+        if len(prompts)==0: prompts = ['']
+    else:
+        prompts = [prompt_text]
+    full_path = path.join(output_folder,'output.txt')
+    counts = {}
+    file_names = []
+    try:
+        counts, file_names = save_prompts(au,names,templates,prompts,skip_tags,full_path,num_shards,sample_rate,seed,include_filter)
+        error = None
+    except Exception as e:
+        error = e
+
+    if len(skip_tags)>0:
+        log.append('List contains '+str(len(names))+' names')
+        log.append('Skip tags: '+str(skip_tags))
+        log.append('Skipped '+str(counts.get('skipped',0))+' names')
+    if include_filter!=None:
+        log.append('Include tags: "'+include_text+'"')
+        log.append('Excluded '+str(counts.get('excluded',0))+' names')
+
+    log.append('Generated prompts for '+str(counts.get('names',0))+' names')
+    if (len(templates)>1) or (len(prompts)>1) or (sample_rate<1):
+        log.append('Templates: '+str(len(templates))+', prompts: '+str(len(prompts))+', sample rate: '+str(sample_rate))
+        log.append('Wrote '+str(counts.get('lines',0))+' lines')
+    if counts.get('removed',0)>0:
+        log.append('Removed '+str(counts['removed'])+' numbered output files of an earlier run')
+    if error!=None:
+        log.append('Error: could not save '+full_path+'\n'+str(error))
+    for file_name in file_names:
+        log.append('Saved '+file_name)
+    log_text = '\n'.join(log)
+    return log_text
+
+#-------------------------------------------------------------------------------
+# Coverage
+#-------------------------------------------------------------------------------
+
+def get_coverage_log(au, names, list_name, folders, max_names=50):
+    au.coverage.update()
+    log = []
+    log.append('List: "'+list_name+'", '+str(len(names))+' names')
+    total = max(1,len(names))
+    for folder, count in au.coverage.get_folder_counts(names,folders).items():
+        log.append(folder+': '+str(count)+' / '+str(len(names))+' ('+'%.1f' % (100*count/total)+'%), '+str(len(names)-count)+' missing')
+    missing = au.coverage.get_missing_names(names,folders)
+    if len(folders)>1:
+        log.append('Missing in any folder: '+str(len(missing)))
+    log.append('No image in any folder: '+str(len(au.coverage.get_missing_names(names,folders,missing_all=True))))
+    for name in missing[:max_names]:
+        log.append(name+': '+', '.join(au.coverage.get_missing_folders(name,folders)))
+    if len(missing)>max_names:
+        log.append('... '+str(len(missing)-max_names)+' more names')
+    return '\n'.join(log)
+
+#-------------------------------------------------------------------------------
+# HTML
+#-------------------------------------------------------------------------------
+
+def get_html_image_src(kind, folder, file_name, data_url):
+    # kind is 'images' or 'assorted', folder is '' for assorted; thumbnails
+    # are kept per size, so changing HTML_THUMBNAIL_SIZE makes new ones
+    # instead of passing the old ones as up to date
+    sub_path = kind+'/'+(folder+'/' if folder!='' else '')
+    if HTML_THUMBNAILS==True:
+        ext = '.jpg' if HTML_THUMBNAIL_FORMAT=='jpeg' else '.'+HTML_THUMBNAIL_FORMAT
+        return 'html_assets/'+str(HTML_THUMBNAIL_SIZE)+'/'+sub_path+file_name+ext
+    return data_url+'/'+sub_path+file_name
+
+def get_html_img_tag(src, tile_map=None):
+    if tile_map!=None:
+        tile = tile_map.get(src,None)
+        if tile!=None:
+            sheet_url, x, y, width, height = tile
+            return ('<div style="display:inline-block;width:'+str(width)+'px;height:'+str(height)+'px;background:url(\''+
+                sheet_url+'\') -'+str(x)+'px -'+str(y)+'px"></div>')
+    lazy_str = ' loading="lazy"' if HTML_LAZY_LOADING==True else ''
+    return '<img src="'+src+'" width='+HTML_WIDTH_STR+', height='+HTML_HEIGHT_STR+lazy_str+'>'
+
+def make_export_thumbnail(job):
+    # runs in a worker process, returns an error message or None
+    src_fnam, dst_fnam, size, image_format = job
+    try:
+        img = Image.open(src_fnam)
+        img.draft('RGB',(size,size))
+        img.thumbnail((size,size))
+        if (image_format=='jpeg') or (not img.mode in ['RGB','RGBA']):
+            img = img.convert('RGB' if image_format=='jpeg' else 'RGBA')
+        makedirs(path.dirname(dst_fnam),exist_ok=True)
+        with open_atomic(dst_fnam,'wb') as f:
+            img.save(f,image_format,quality=80)
+    except Exception as e:
+        return src_fnam+': '+str(e)
+    return None
+
+def iter_html_image_files(au, names, image_folders, data_url):
+    for name in names:
+        for folder in image_folders:
+            if folder=='': continue
+            img_name = au.find_image_filename(folder,name)
+            if img_name!=None:
+                yield path.join(au.images_folder,folder,img_name), get_html_image_src('images',folder,img_name,data_url)
+        if HTML_ADD_ASSORTED==True:
+            for file_name in au.get_assorted_filenames(name):
+                yield path.join(au.assorted_folder,file_name), get_html_image_src('assorted','',file_name,data_url)
+
+def build_html_thumbnails(au, names, image_folders, output_folder, data_url):
+    jobs = []
+    seen = set()
+    num_skipped = 0
+    for src_fnam, src in iter_html_image_files(au, names, image_folders, data_url):
+        if src in seen: continue
+        seen.add(src)
+        dst_fnam = path.join(output_folder,*src.split('/'))
+        try:
+            if stat(dst_fnam).st_mtime>=stat(src_fnam).st_mtime:
+                num_skipped += 1
+                continue
+        except OSError:
+            pass
+        jobs.append((src_fnam,dst_fnam,HTML_THUMBNAIL_SIZE,HTML_THUMBNAIL_FORMAT))
+
+    errors = map_processes(make_export_thumbnail,jobs,chunksize=32,min_jobs=1)
+    errors = [x for x in errors if x!=None]
+    for error in errors:
+        print('warning: error making thumbnail ',error)
+    return len(jobs)-len(errors), num_skipped, len(errors)
+
+def iter_html_table(au, names, image_folders, data_url, first_index=0, tile_map=None):
+    yield '<table border='+HTML_BORDER_STR+'>'
+    yield '  <tr>'
+
+    if HTML_ADD_INDEX==True:
+        yield '    <th></th>'
+    yield '    <th>Name</th>'
+    for folder in image_folders:
+        if folder=='': continue
+        yield '    <th>'+folder+'</th>'
+    if HTML_ADD_TAGS==True:
+        yield '    <th>Tags</th>'
+
+    if HTML_ADD_ASSORTED==True:
+        yield '    <th>Other</th>'
+
+    yield '  </tr>'
+
+    for n in range(len(names)):
+        yield '  <tr>'
+        name = names[n]
+        if HTML_ADD_INDEX==True:
+            yield '    <td>'+str(first_index+n)+'</td>'
+        yield '    <td>'+name+'</td>'
+
+        for folder in image_folders:
+            if folder=='': continue
+            img_name = au.find_image_filename(folder,name)
+            if img_name==None:
+                yield '    <td></td>'
+            else:
+                img_path = get_html_image_src('images',folder,img_name,data_url)
+                yield '    <td>'+get_html_img_tag(img_path,tile_map)+'</td>'
+
+        if HTML_ADD_TAGS==True:
+            tag_list = au.get_name_tags(name)
+            tag_str = str(tag_list)
+            yield '    <td>'+tag_str+'</td>'
+
+        if HTML_ADD_ASSORTED==True:
+
+            files = au.get_assorted_filenames(name)
+            all_files = []
+            for file in files:
+                file_path = get_html_image_src('assorted','',file,data_url)
+                all_files.append(get_html_img_tag(file_path,tile_map))
+            total_str=''.join(all_files)
+            yield '    <td>'+total_str+'</td>'
+
+        yield '  </tr>'
+    yield '</table>'
+
+def iter_html_atlas_groups(au, names, image_folders, data_url):
+    # one group of (image file, src) per page and folder, so a page only
+    # needs its own sheets
+    page_size = HTML_PAGE_SIZE if HTML_PAGE_SIZE>0 else max(len(names),1)
+    for first in range(0,len(names),page_size):
+        page_names = names[first:first+page_size]
+        page_str = '' if page_size>=len(names) else 'p'+str(first//page_size+1).zfill(4)+'_'
+        for folder in image_folders:
+            if folder=='': continue
+            items = []
+            for name in page_names:
+                img_name = au.find_image_filename(folder,name)
+                if img_name!=None:
+                    items.append((path.join(au.images_folder,folder,img_name),get_html_image_src('images',folder,img_name,data_url)))
+            yield page_str+'images_'+folder, items
+        if HTML_ADD_ASSORTED==True:
+            items = []
+            for name in page_names:
+                for file_name in au.get_assorted_filenames(name):
+                    items.append((path.join(au.assorted_folder,file_name),get_html_image_src('assorted','',file_name,data_url)))
+            yield page_str+'assorted', items
+
+def build_html_atlas(au, names, image_folders, output_folder, data_url):
+    groups = list(iter_html_atlas_groups(au,names,image_folders,data_url))
+    return build_atlas(groups,path.join(output_folder,'html_assets','atlas'),'html_assets/atlas')
+
+def iter_html_page(body_iter):
+    yield '<html>'
+    yield '<head></head>'
+    yield '<body>'
+    yield from body_iter
+    yield '</body>'
+    yield '</html>'
+
+def iter_html_nav(page_no, page_files, index_file):
+    links = ['<a href="'+index_file+'">index</a>']
+    if page_no>0:
+        links.append('<a href="'+page_files[page_no-1]+'">prev</a>')
+    if page_no<len(page_files)-1:
+        links.append('<a href="'+page_files[page_no+1]+'">next</a>')
+    yield '<p>page '+str(page_no+1)+' / '+str(len(page_files))+' : '+' | '.join(links)+'</p>'
+
+def iter_html_index(names, page_files):
+    yield '<ul>'
+    for page_no in range(len(page_files)):
+        first = page_no*HTML_PAGE_SIZE
+        last = min(first+HTML_PAGE_SIZE,len(names))-1
+        yield ('  <li><a href="'+page_files[page_no]+'">'+str(first)+' - '+str(last)+' : '+
+            names[first]+' ... '+names[last]+'</a></li>')
+    yield '</ul>'
+
+def export_html(au, names, image_folders, output_folder):
+    log = []
+    full_path = path.join(output_folder,'html_output.html')
+    # image links are relative to the html file
+    data_url = path.relpath(au.data_folder,output_folder).replace(path.sep,'/')
+    tile_map = None
+    try:
+        if HTML_ATLAS==True:
+            tile_map, num_made, num_skipped, errors = build_html_atlas(au,names,image_folders,output_folder,data_url)
+            for error in errors:
+                print('warning: error making sprite sheet ',error)
+            log.append('Sprite sheets: '+str(num_made)+' made, '+str(num_skipped)+' up to date, '+str(len(errors))+' errors')
+        elif HTML_THUMBNAILS==True:
+            num_made, num_skipped, num_errors = build_html_thumbnails(au,names,image_folders,output_folder,data_url)
+            log.append('Thumbnails: '+str(num_made)+' made, '+str(num_skipped)+' up to date, '+str(num_errors)+' errors')
+        if (HTML_PAGE_SIZE<=0) or (len(names)<=HTML_PAGE_SIZE):
+            save_string_iter(iter_html_page(iter_html_table(au,names,image_folders,data_url,0,tile_map)),full_path)
+        else:
+            index_file = path.basename(full_path)
+            num_pages = (len(names)+HTML_PAGE_SIZE-1)//HTML_PAGE_SIZE
+            page_files = ['html_output_'+str(n+1).zfill(len(str(num_pages)))+'.html' for n in range(num_pages)]
+            for page_no in range(num_pages):
+                first = page_no*HTML_PAGE_SIZE
+                page_names = names[first:first+HTML_PAGE_SIZE]
+                nav = list(iter_html_nav(page_no,page_files,index_file))
+                page_body = chain(nav,iter_html_table(au,page_names,image_folders,data_url,first,tile_map),nav)
+                save_string_iter(iter_html_page(page_body),path.join(output_folder,page_files[page_no]))
+            log.append('Saved '+str(num_pages)+' pages of '+str(HTML_PAGE_SIZE)+' names')
+            save_string_iter(iter_html_page(iter_html_index(names,page_files)),full_path)
+        log.append('Saved '+full_path)
+    except Exception as e:
+        log.append('Error: could not save '+full_path+'\n'+str(e))
+
+    log_text = '\n'.join(log)
+    return log_text
@@ -0,0 +1,113 @@
+# Artist-Util grid view, a page of names x folders as one labelled image
+#
+# https://github.com/tkalayci71/artist-util
+
+from collections import OrderedDict
+from functools import partial
+from PIL import Image, ImageDraw
+import threading
+
+from lib_artist_util.engine import stats, timed
+
+#-------------------------------------------------------------------------------
+# Options
+#-------------------------------------------------------------------------------
+
+GRID_NAMES = 48 # names per page
+GRID_COLUMNS = 3 # names side by side, each name is a label over one tile per folder
+GRID_TILE_SIZE = 96 # max width/height of an image in the grid
+GRID_LABEL_HEIGHT = 16
+GRID_CACHE_PAGES = 8 # composited pages kept in memory
+
+GRID_BACKGROUND = (255,255,255)
+GRID_MISSING = (224,224,224) # tile color of names without an image in a folder
+GRID_TEXT = (0,0,0)
+
+#-------------------------------------------------------------------------------
+# Grid
+#-------------------------------------------------------------------------------
+
+def get_num_pages(num_names, page_size=GRID_NAMES):
+    page_size = max(1,page_size)
+    return max(1,(num_names+page_size-1)//page_size)
+
+def get_fitting_text(draw, text, width):
+    if draw.textlength(text)<=width: return text
+    while (len(text)>0) and (draw.textlength(text+'...')>width):
+        text = text[:-1]
+    return text+'...'
+
+def compose_grid(names, folders, tiles, tile_size=GRID_TILE_SIZE, columns=GRID_COLUMNS, label_height=GRID_LABEL_HEIGHT):
+    # tiles[n*len(folders)+f] is names[n]'s image in folders[f] or None; the
+    # first row labels the folders of each column
+    columns = max(1,min(columns,len(names)))
+    num_rows = (len(names)+columns-1)//columns
+    cell_width = max(1,len(folders))*tile_size
+    cell_height = label_height+tile_size
+    grid = Image.new('RGB',(columns*cell_width,label_height+num_rows*cell_height),GRID_BACKGROUND)
+    draw = ImageDraw.Draw(grid)
+    for column in range(columns):
+        for f in range(len(folders)):
+            x = column*cell_width+f*tile_size
+            draw.text((x+2,2),get_fitting_text(draw,folders[f],tile_size-4),fill=GRID_TEXT)
+    for n in range(len(names)):
+        x = (n%columns)*cell_width
+        y = label_height+(n//columns)*cell_height
+        draw.text((x+2,y+2),get_fitting_text(draw,names[n],cell_width-4),fill=GRID_TEXT)
+        for f in range(len(folders)):
+            tile_x = x+f*tile_size
+            tile_y = y+label_height
+            tile = tiles[n*len(folders)+f]
+            if tile==None:
+                draw.rectangle((tile_x+1,tile_y+1,tile_x+tile_size-2,tile_y+tile_size-2),fill=GRID_MISSING)
+                continue
+            grid.paste(tile,(tile_x+(tile_size-tile.width)//2,tile_y+(tile_size-tile.height)//2))
+    return grid
+
+class AuGrid:
+
+    # composited pages by (list, page, folders), an entry is used again only
+    # if the names and the image files found for them are the same
+
+    def __init__(self, au, tile_size=GRID_TILE_SIZE, columns=GRID_COLUMNS, max_pages=GRID_CACHE_PAGES):
+        self.au = au
+        self.tile_size = tile_size
+        self.columns = columns
+        self.max_pages = max_pages
+        self.lock = threading.Lock()
+        self.pages = OrderedDict()
+
+    def load_tile(self, folder, name):
+        # runs on the engine's load pool, images come from its thumbnail cache
+        img = self.au.load_image(folder,name)
+        if img==None: return None
+        img = img.copy()
+        img.thumbnail((self.tile_size,self.tile_size))
+        if img.mode!='RGB':
+            img = img.convert('RGB')
+        return img
+
+    @timed('grid.get_page')
+    def get_page(self, list_name, names, page, folders, page_size=GRID_NAMES):
+        # returns the page's grid image and the page, which is kept in range
+        page_size = max(1,page_size)
+        page = max(0,min(page,get_num_pages(len(names),page_size)-1))
+        page_names = names[page*page_size:(page+1)*page_size]
+        folders = [x for x in folders if x!='']
+        key = (list_name,page,tuple(folders))
+        files = (tuple(page_names),tuple(self.au.find_image_filename(folder,name) for name in page_names for folder in folders))
+        with self.lock:
+            entry = self.pages.get(key,None)
+            if (entry!=None) and (entry[0]==files):
+                self.pages.move_to_end(key)
+                stats.count('grid_hits')
+                return entry[1], page
+        stats.count('grid_misses')
+        tasks = [partial(self.load_tile,folder,name) for name in page_names for folder in folders]
+        grid = compose_grid(page_names,folders,self.au.run_tasks(tasks),self.tile_size,self.columns)
+        with self.lock:
+            self.pages[key] = (files,grid)
+            self.pages.move_to_end(key)
+            while len(self.pages)>self.max_pages:
+                self.pages.popitem(last=False)
+        return grid, page
@@ -0,0 +1,281 @@
+# Artist-Util similar names, colour and layout features of the folder images
+#
+# https://github.com/tkalayci71/artist-util
+
+from os import path, stat
+from PIL import Image
+import numpy as np
+import threading
+
+from lib_artist_util.engine import timed, stats, open_atomic, map_processes
+
+#-------------------------------------------------------------------------------
+# Options
+#-------------------------------------------------------------------------------
+
+SIMILAR_MAX_RESULTS = 50 # names listed under Similar
+SIMILAR_NEIGHBORS = 10 # most similar names voting for suggested tags
+SIMILAR_MIN_VOTE = 0.5 # share of the neighbors' similarity a tag needs to be suggested
+
+#-------------------------------------------------------------------------------
+# Features
+#-------------------------------------------------------------------------------
+
+FEATURE_SIZE = 64 # images are reduced to this size before anything else
+FEATURE_HSV_BINS = (12,2,2) # hue, saturation, value
+FEATURE_LAYOUT_SIZE = 4 # RGB colours of a 4x4 grid
+FEATURE_LAYOUT_WEIGHT = 0.5
+FEATURE_DIM = FEATURE_HSV_BINS[0]*FEATURE_HSV_BINS[1]*FEATURE_HSV_BINS[2]+FEATURE_LAYOUT_SIZE*FEATURE_LAYOUT_SIZE*3
+
+def get_image_features(file_name):
+    # runs in a worker process; a unit length vector made of a square rooted
+    # HSV histogram and a coarse colour layout, None for files that are not
+    # images
+    try:
+        img = Image.open(file_name)
+        img.draft('RGB',(FEATURE_SIZE,FEATURE_SIZE))
+        img = img.convert('RGB')
+        img.thumbnail((FEATURE_SIZE,FEATURE_SIZE))
+        hsv = np.asarray(img.convert('HSV'),dtype=np.int32).reshape(-1,3)
+        h_bins, s_bins, v_bins = FEATURE_HSV_BINS
+        bins = ((hsv[:,0]*h_bins>>8)*s_bins+(hsv[:,1]*s_bins>>8))*v_bins+(hsv[:,2]*v_bins>>8)
+        hist = np.sqrt(np.bincount(bins,minlength=h_bins*s_bins*v_bins)/len(bins))
+        layout = np.asarray(img.resize((FEATURE_LAYOUT_SIZE,FEATURE_LAYOUT_SIZE),Image.BILINEAR),dtype=np.float64).reshape(-1)/255
+        layout -= layout.mean()
+        layout_norm = np.linalg.norm(layout)
+        if layout_norm>0:
+            layout *= FEATURE_LAYOUT_WEIGHT/layout_norm
+        result = np.concatenate([hist/max(np.linalg.norm(hist),1e-6),layout])
+        return (result/np.linalg.norm(result)).astype(np.float32)
+    except Exception:
+        return None
+
+#-------------------------------------------------------------------------------
+# AuSimilarIndex class
+#-------------------------------------------------------------------------------
+
+class AuSimilarIndex:
+
+    # one feature row per image file, cached in data/image_features.npz with
+    # mtime and size; for every image folder a (names x features) matrix
+    # holds the features of each name's image in that folder, zero where
+    # there is none, so a query is one matrix-vector product per folder
+
+    def __init__(self, au, num_workers=None):
+        self.au = au
+        self.num_workers = num_workers
+        self.cache_fnam = path.join(au.data_folder,'image_features.npz')
+        self.lock = threading.Lock()
+        self.file_rows = None # rel path -> row in features
+        self.file_stats = []
+        self.features = np.zeros((0,FEATURE_DIM),dtype=np.float32)
+        self.names = None
+        self.name_rows = {}
+        self.folder_lists = {} # folder -> image list the matrix was built from
+        self.folder_matrices = {} # folder -> (matrix, has image)
+
+    def load_cache(self):
+        self.file_rows = {}
+        if not path.exists(self.cache_fnam): return
+        stats.count('file_reads')
+        try:
+            with np.load(self.cache_fnam) as data:
+                features = data['features']
+                if features.shape[1]!=FEATURE_DIM: return
+                files = [str(x) for x in data['files']]
+                self.file_stats = [tuple(x) for x in data['stats'].tolist()]
+                self.features = features
+                self.file_rows = {files[n]:n for n in range(len(files))}
+        except Exception as e:
+            print('warning: ignoring '+self.cache_fnam+' ('+str(e)+')')
+            self.file_rows = {}
+            self.file_stats = []
+
+    def save_cache(self):
+        files = [None]*len(self.file_rows)
+        for rel_path, row in self.file_rows.items():
+            files[row] = rel_path
+        with open_atomic(self.cache_fnam,'wb') as f:
+            np.savez(f,files=np.array(files,dtype=str),stats=np.array(self.file_stats,dtype=np.int64).reshape(-1,2),features=self.features)
+
+    def update_files(self, files):
+        # files: rel path -> full file name; computes features of new and
+        # changed files, returns how many
+        jobs = []
+        for rel_path, file_name in files.items():
+            try:
+                st = stat(file_name)
+            except OSError:
+                continue
+            file_stat = (st.st_mtime_ns,st.st_size)
+            row = self.file_rows.get(rel_path,None)
+            if (row!=None) and (self.file_stats[row]==file_stat): continue
+            jobs.append((rel_path,file_name,file_stat))
+        if len(jobs)==0: return 0
+        stats.count('image_features',len(jobs))
+        results = map_processes(get_image_features,[x[1] for x in jobs],self.num_workers,chunksize=32,min_jobs=33)
+        new_rows = []
+        for (rel_path, file_name, file_stat), features in zip(jobs,results):
+            if features is None:
+                features = np.zeros(FEATURE_DIM,dtype=np.float32)
+            row = self.file_rows.get(rel_path,None)
+            if row!=None:
+                self.features[row] = features
+                self.file_stats[row] = file_stat
+            else:
+                self.file_rows[rel_path] = len(self.file_stats)
+                self.file_stats.append(file_stat)
+                new_rows.append(features)
+        if len(new_rows)>0:
+            self.features = np.vstack([self.features,np.stack(new_rows)])
+        return len(jobs)
+
+    @timed('similar.update')
+    def update(self, folders):
+        # rebuilds the matrices of folders whose image list or the roster
+        # changed, returns the number of images whose features were computed
+        with self.lock:
+            if self.file_rows==None:
+                self.load_cache()
+            if not self.names is self.au.all_names_list:
+                self.names = self.au.all_names_list
+                self.name_rows = {self.names[n]:n for n in range(len(self.names))}
+                self.folder_lists = {}
+                self.folder_matrices = {}
+            for folder in list(self.folder_matrices.keys()):
+                if not folder in self.au.image_subfolder_choices:
+                    del self.folder_matrices[folder]
+                    del self.folder_lists[folder]
+            num_computed = 0
+            for folder in folders:
+                if folder=='': continue
+                image_files = self.au.get_image_files(folder)
+                if (image_files==None) or (self.folder_lists.get(folder,None) is image_files): continue
+                # roster names are looked up in the engine's image index
+                # directly, as find_image_filename would
+                image_index = self.au.image_index.get(folder,{})
+                name_files = {}
+                for name in self.names:
+                    file_name = image_index.get(name,None)
+                    if file_name!=None:
+                        name_files[name] = 'images/'+folder+'/'+file_name
+                num_computed += self.update_files({x:path.join(self.au.data_folder,*x.split('/')) for x in name_files.values()})
+                rows = np.full(len(self.names),-1,dtype=np.int64)
+                for name, rel_path in name_files.items():
+                    rows[self.name_rows[name]] = self.file_rows[rel_path]
+                has_image = rows>=0
+                matrix = self.features[np.maximum(rows,0)]
+                matrix[~has_image] = 0
+                # images that could not be read have zero features too
+                has_image &= matrix.any(axis=1)
+                self.folder_matrices[folder] = (matrix,has_image)
+                self.folder_lists[folder] = image_files
+            if num_computed>0:
+                self.save_cache()
+            return num_computed
+
+    def get_matrices(self, folders):
+        return [self.folder_matrices[x] for x in set(folders) if x in self.folder_matrices]
+
+    def get_scores(self, name_indexes, matrices):
+        # (len(name_indexes) x names) mean cosine similarity over the folders
+        # each queried name has an image in; a missing image counts as 0
+        scores = np.zeros((len(name_indexes),len(self.names)),dtype=np.float32)
+        counts = np.zeros(len(name_indexes),dtype=np.float32)
+        for matrix, has_image in matrices:
+            queries = matrix[name_indexes]
+            scores += queries @ matrix.T
+            counts += has_image[name_indexes]
+        scores /= np.maximum(counts,1)[:,None]
+        scores[np.arange(len(name_indexes)),name_indexes] = -np.inf
+        return scores, counts
+
+    def get_top(self, scores, count):
+        count = min(count,len(scores)-1)
+        if count<=0: return []
+        top = np.argpartition(-scores,count-1)[:count]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[n]),self.names[n]) for n in top if scores[n]>0]
+
+    @timed('similar.find_similar')
+    def find_similar(self, name, folders, count=SIMILAR_MAX_RESULTS, candidates=None):
+        # (score, name) pairs, most similar first, only names in candidates
+        # if given
+        self.update(folders)
+        with self.lock:
+            name_index = self.name_rows.get(name,None)
+            if name_index==None: return []
+            scores, counts = self.get_scores([name_index],self.get_matrices(folders))
+            if counts[0]==0: return []
+            if candidates!=None:
+                keep = np.zeros(len(self.names),dtype=bool)
+                keep[[self.name_rows[x] for x in candidates if x in self.name_rows]] = True
+                scores[0,~keep] = -np.inf
+            return self.get_top(scores[0],count)
+
+    def get_tag_matrix(self):
+        # (names x tags) 0/1 and the tags
+        with self.au.tag_lock:
+            tag_choices = self.au.tag_choices
+            tag_sets = [self.au.tag_sets[x] for x in tag_choices]
+            result = np.zeros((len(self.names),len(tag_sets)),dtype=np.float32)
+            for n in range(len(tag_sets)):
+                rows = [self.name_rows[x] for x in tag_sets[n] if x in self.name_rows]
+                result[rows,n] = 1
+        return result, tag_choices
+
+    @timed('similar.suggest_tags')
+    def suggest_tags(self, names, folders, num_neighbors=SIMILAR_NEIGHBORS, min_vote=SIMILAR_MIN_VOTE, batch_size=256):
+        # name -> [(vote, tag)] for tags that the name's most similar names
+        # mostly have and the name itself doesn't
+        self.update(folders)
+        result = {}
+        with self.lock:
+            tag_matrix, tag_choices = self.get_tag_matrix()
+            indexes = [self.name_rows[x] for x in names if x in self.name_rows]
+            num_neighbors = min(num_neighbors,len(self.names)-1)
+            if (num_neighbors<=0) or (tag_matrix.shape[1]==0): return result
+            # the folder matrices side by side give the same sums in one
+            # product per batch
+            matrices = self.get_matrices(folders)
+            if len(matrices)>1:
+                matrices = [(np.concatenate([x[0] for x in matrices],axis=1),sum(x[1].astype(np.float32) for x in matrices))]
+            for first in range(0,len(indexes),batch_size):
+                batch = indexes[first:first+batch_size]
+                scores, counts = self.get_scores(batch,matrices)
+                top = np.argpartition(scores,-num_neighbors,axis=1)[:,-num_neighbors:]
+                weights = np.maximum(np.take_along_axis(scores,top,axis=1),0)
+                votes = np.einsum('bk,bkt->bt',weights,tag_matrix[top])/np.maximum(weights.sum(axis=1),1e-6)[:,None]
+                votes[tag_matrix[batch]>0] = 0
+                for n in range(len(batch)):
+                    if counts[n]==0: continue
+                    tags = [(float(votes[n,t]),tag_choices[t]) for t in np.nonzero(votes[n]>=min_vote)[0]]
+                    if len(tags)>0:
+                        result[self.names[batch[n]]] = sorted(tags,reverse=True)
+        return result
+
+#-------------------------------------------------------------------------------
+# Logs
+#-------------------------------------------------------------------------------
+
+def get_similar_log(name, folders, similar):
+    log = ['Name: "'+name+'", folders: '+', '.join(x for x in folders if x!='')]
+    if len(similar)==0:
+        log.append('No similar names, the name needs an image in one of the folders')
+    for score, other in similar:
+        log.append('%.3f' % score+' '+other)
+    return '\n'.join(log)
+
+def save_tag_suggestions(suggestions, list_name, num_names, file_name, max_lines=50):
+    lines = [name+': '+', '.join(tag+' '+'%.2f' % vote for vote, tag in tags) for name, tags in suggestions.items()]
+    log = ['List: "'+list_name+'", suggested tags for '+str(len(suggestions))+' of '+str(num_names)+' names']
+    try:
+        with open(file_name,'w',encoding='utf-8') as f:
+            f.write('\n'.join(lines))
+        log.append('Saved '+file_name)
+    except Exception as e:
+        log.append('Error: could not save '+file_name+'\n'+str(e))
+    log.extend(lines[:max_lines])
+    if len(lines)>max_lines:
+        log.append('... '+str(len(lines)-max_lines)+' more names')
+    return '\n'.join(log)
@@ -0,0 +1,166 @@
+# Artist-Util file watcher, applies changes in the data folder to a running engine
+#
+# https://github.com/tkalayci71/artist-util
+
+from os import path, scandir, stat, sep
+import threading
+
+from lib_artist_util.engine import stats
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None # without watchdog the files are polled
+
+#-------------------------------------------------------------------------------
+# Options
+#-------------------------------------------------------------------------------
+
+WATCH_FILES = True # False # apply changes of names.txt, templates.txt, tags/ and images/ without "Reload UI"
+WATCH_INTERVAL = 1.0 # seconds between applying changes, and between polls without watchdog
+WATCH_POLLING = False # True # poll even if watchdog (inotify etc.) is installed
+
+#-------------------------------------------------------------------------------
+# AuWatcher class
+#-------------------------------------------------------------------------------
+
+def get_mtime(file_name):
+    try:
+        return stat(file_name).st_mtime_ns
+    except OSError:
+        return None
+
+class AuWatcher:
+
+    # with watchdog the changed paths are collected as events arrive, and
+    # only the changed image files are added or removed; otherwise the mtimes
+    # of the watched files and folders are compared, and an image folder
+    # whose mtime changed is rescanned; either way one thread applies them
+    # every WATCH_INTERVAL, so a burst of new images is applied at once
+
+    CHANGE_NAMES = ('names','')
+    CHANGE_TEMPLATES = ('templates','')
+    CHANGE_FOLDERS = ('folders','') # subfolders of images/ added or removed
+
+    def __init__(self, au, interval=WATCH_INTERVAL, use_polling=WATCH_POLLING):
+        self.au = au
+        self.interval = interval
+        self.use_polling = use_polling or (Observer==None)
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.mtimes = {}
+        self.observer = None
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if not self.use_polling:
+            try:
+                handler = FileSystemEventHandler()
+                handler.on_any_event = self.on_event
+                self.observer = Observer()
+                self.observer.schedule(handler,self.au.data_folder,recursive=True)
+                self.observer.daemon = True
+                self.observer.start()
+            except Exception as e:
+                print('warning: file events failed, polling instead ('+str(e)+')')
+                self.observer = None
+                self.use_polling = True
+        if self.use_polling:
+            self.mtimes = self.get_mtimes()
+        self.thread = threading.Thread(target=self.run,name='artist_util_watcher',daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.observer!=None:
+            self.observer.stop()
+            self.observer = None
+
+    def get_change(self, file_name):
+        # ('names'|'templates'|'folders', ''), ('tag', tag name) or ('image',
+        # folder, file name) for a path in the data folder, None for paths
+        # that are not watched
+        if (file_name==None) or (file_name==''): return None
+        rel_path = path.relpath(file_name,self.au.data_folder).replace(sep,'/')
+        if rel_path.endswith('.tmp'): return None
+        parts = rel_path.split('/')
+        if rel_path=='names.txt': return self.CHANGE_NAMES
+        if rel_path=='templates.txt': return self.CHANGE_TEMPLATES
+        if (len(parts)==2) and (parts[0]=='tags') and parts[1].endswith('.txt'):
+            return ('tag',parts[1][:-4])
+        if (len(parts)==2) and (parts[0]=='images'): return self.CHANGE_FOLDERS
+        if (len(parts)==3) and (parts[0]=='images'): return ('image',parts[1],parts[2])
+        return None
+
+    def on_event(self, event):
+        # called on watchdog's thread; a folder's modified event only means
+        # its files changed, and those have their own events
+        if event.is_directory and (event.event_type=='modified'): return
+        for file_name in [event.src_path,getattr(event,'dest_path',None)]:
+            change = self.get_change(file_name)
+            if change!=None:
+                with self.lock:
+                    self.pending.add(change)
+
+    def get_mtimes(self):
+        result = {}
+        result[self.CHANGE_NAMES] = get_mtime(path.join(self.au.data_folder,'names.txt'))
+        result[self.CHANGE_TEMPLATES] = get_mtime(path.join(self.au.data_folder,'templates.txt'))
+        if path.exists(self.au.tags_folder):
+            for it in scandir(self.au.tags_folder):
+                if it.is_file() and it.name.endswith('.txt'):
+                    result[('tag',it.name[:-4])] = it.stat().st_mtime_ns
+        # new files change their folder's mtime, new folders that of images/
+        result[self.CHANGE_FOLDERS] = get_mtime(self.au.images_folder)
+        if path.exists(self.au.images_folder):
+            for it in scandir(self.au.images_folder):
+                if it.is_dir():
+                    result[('image_folder',it.name)] = it.stat().st_mtime_ns
+        return result
+
+    def get_changes(self):
+        if self.use_polling:
+            mtimes = self.get_mtimes()
+            changes = set(x for x in set(mtimes)|set(self.mtimes) if mtimes.get(x,None)!=self.mtimes.get(x,None))
+            self.mtimes = mtimes
+            return changes
+        with self.lock:
+            changes = self.pending
+            self.pending = set()
+        return changes
+
+    def apply_changes(self, changes):
+        # returns the names of what was reloaded
+        result = []
+        if (self.CHANGE_NAMES in changes) and self.au.reload_names():
+            result.append('names')
+        tag_names = [x[1] for x in changes if x[0]=='tag']
+        if (len(tag_names)>0) and self.au.reload_tags(tag_names):
+            result.append('tags')
+        if (self.CHANGE_TEMPLATES in changes) and self.au.reload_templates():
+            result.append('templates')
+        if (self.CHANGE_FOLDERS in changes) and self.au.reload_image_folders():
+            result.append('image folders')
+        folder_files = {}
+        for change in changes:
+            if change[0]=='image':
+                folder_files.setdefault(change[1],[]).append(change[2])
+        for folder, file_names in sorted(folder_files.items()):
+            if self.au.update_image_file_names(folder,file_names):
+                result.append('images in '+folder)
+        for change in changes:
+            if change[0]=='image_folder':
+                self.au.rescan_image_folder(change[1])
+        return result
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                reloaded = self.apply_changes(self.get_changes())
+            except Exception as e:
+                print('warning: could not apply file changes ('+str(e)+')')
+                continue
+            if len(reloaded)>0:
+                stats.count('watcher_reloads')
+                print('Artist-Util: reloaded '+', '.join(reloaded))
@@ -3,15 +3,37 @@
 # https://github.com/tkalayci71/artist-util
 # version 1.0 - 2023.01.23
 
-import gradio as gr
 from modules.script_callbacks import on_ui_tabs
+try:
+    from modules.script_callbacks import on_script_unloaded
+except ImportError:
+    on_script_unloaded = None # older webui versions
 from modules.scripts import basedir
-from os import path, scandir, makedirs
-from PIL import Image
+from os import path
+import atexit
+import sys
+import threading
+import time
 
 BASE_FOLDER = path.join(basedir(),'')
 DATA_FOLDER = path.join(BASE_FOLDER,'data','')
 
+# the engine and exports live in lib_artist_util/ so they can be imported and
+# run from the command line without the webui, see lib_artist_util/cli.py
+if not path.normpath(BASE_FOLDER) in sys.path:
+    sys.path.insert(0,path.normpath(BASE_FOLDER))
+
+from lib_artist_util import export, dupes, watcher
+from lib_artist_util.engine import AuEngine, AuSession, stats, timed, save_string_list
+from lib_artist_util.export import export_prompts, export_html, get_coverage_log
+from lib_artist_util.dupes import AuHashIndex, get_duplicates_log, get_name_duplicates_log
+from lib_artist_util.similar import AuSimilarIndex, get_similar_log, save_tag_suggestions
+from lib_artist_util.atlas import compose_sheet
+from lib_artist_util.watcher import AuWatcher
+from lib_artist_util.grid import AuGrid, GRID_NAMES, get_num_pages
+
+gr = None # gradio, imported in add_tab
+
 #-------------------------------------------------------------------------------
 # Options
 #-------------------------------------------------------------------------------
@@ -21,581 +43,445 @@ IMAGE_PER_ROW = 4
 
 SHOW_ASSORTED = False # True
 RIGHT_ALIGN_ASSORTED = False # True
+ASSORTED_SHEET = False # True # show a name's assorted images as one contact sheet image
+ASSORTED_SHEET_SIZE = 256 # max width/height of an image in the contact sheet
+ASSORTED_SHEET_COLUMNS = 4
 
-HTML_ADD_INDEX = False # True
-HTML_BORDER_STR = '0' # '1'
-HTML_WIDTH_STR = '128'
-HTML_HEIGHT_STR = '128'
-HTML_ADD_TAGS = True # False # True
-HTML_ADD_ASSORTED = False # True
-
-#-------------------------------------------------------------------------------
-# Utils
-#-------------------------------------------------------------------------------
-
-def make_sure_dir_exists(dir_name):
-    if not path.exists(dir_name):
-        makedirs(dir_name)
-    if not path.exists(dir_name):
-        raise
-
-def get_folder_list(dir_name):
-    if not path.exists(dir_name):
-        return []
-    result = []
-    for it in scandir(dir_name):
-        if it.is_dir():
-            result.append(it.name)
-    return result
-
-def get_file_list(dir_name, ext='', remove_ext=False):
-    if not path.exists(dir_name):
-         return []
-    result = []
-    for it in scandir(dir_name):
-        if it.is_file():
-            if ext!='':
-                if not it.name.endswith('.'+ext):
-                    continue
-            file_name = it.name
-            if remove_ext:
-                file_name = path.splitext(file_name)[0]
-            result.append(file_name)
-    return result
-
-def load_string_list(file_name, process=False, addempty=False):
-    if not path.exists(file_name):
-        return []
-    result=[]
-    with open(file_name,encoding='utf-8') as f:
-        lines = f.readlines()
-        for line in lines:
-            line = line.replace('\n','')
-            line = line.strip()
-            if (addempty==True) or (line!=''):
-                result.append(line)
-        f.close()
-    if process:
-        result = [x.lower() for x in result]
-        old_len = len(result)
-        result = list(dict.fromkeys(result))
-        new_len = len(result)
-        if (old_len!=new_len):
-            print('warning : ignoring ',str(new_len-old_len),' duplicates in ',file_name)
-        result.sort()
-    return result
-
-def save_string_list(string_list, file_name, overwrite):
-    if path.exists(file_name):
-        if overwrite==False:
-            return
-    with open(file_name,'w',encoding='utf-8',) as f:
-        f.writelines('\n'.join(string_list))
-        f.close()
-    return
-
-def get_list_index(source_list, item, is_list_sorted=False):
-    try:
-        found_index = source_list.index(item)
-    except:
-        found_index = -1
-    return found_index
-
-#-------------------------------------------------------------------------------
-# AuEngine class
-#-------------------------------------------------------------------------------
-
-class AuEngine:
-
-    SPECIAL_ALL = '- All -'
-    SPECIAL_NOTAG = '- Uncategorized -'
-
-    def __init__(self, data_folder):
-
-        self.data_folder = data_folder
-        make_sure_dir_exists(self.data_folder)
-        self.images_folder = path.join(self.data_folder,'images','')
-        make_sure_dir_exists(self.images_folder)
-        self.tags_folder = path.join(self.data_folder,'tags','')
-        make_sure_dir_exists(self.tags_folder)
-        self.assorted_folder = path.join(self.data_folder,'assorted','')
-        make_sure_dir_exists(self.assorted_folder)
-
-        if (SHOW_ASSORTED==True) or (HTML_ADD_ASSORTED==True):
-            self.assorted_images = get_file_list(self.assorted_folder)
-        else:
-            self.assorted_images = []
-
-        self.image_subfolder_choices = get_folder_list(self.images_folder)
-        self.image_subfolder_choices.sort()
-
-        self.image_files = {}
-        for subfolder in self.image_subfolder_choices:
-            file_list = get_file_list(path.join(self.images_folder,subfolder,''))
-            file_list.sort()
-            self.image_files[subfolder] = file_list
-
-        self.tag_choices = get_file_list(self.tags_folder,ext='txt',remove_ext=True)
-        self.tag_choices.sort()
-
-        self.tag_data = {}
-        for tag_name in self.tag_choices:
-            self.tag_data[tag_name]=load_string_list(path.join(self.tags_folder,tag_name+'.txt'),process=True)
-
-        self.template_choices = load_string_list(path.join(self.data_folder,'templates.txt'),process=False)
-
-        self.all_names_list = load_string_list(path.join(self.data_folder,'names.txt'),process=True)
-
-        self.list_choices = [self.SPECIAL_ALL, self.SPECIAL_NOTAG]+ self.tag_choices
-        self.selected_list = ''
-        self.selected_list_index = -1
-
-        self.name_choices = []
-        self.selected_name = ''
-        self.selected_name_index = -1
-        self.default_name_indexes = {}
-
-    def select_list(self, item):
-        found_index = get_list_index(self.list_choices, item)
-        if found_index==-1:
-            self.selected_list = ''
-            self.selected_list_index = -1
-            self.name_choices = []
-            self.selected_name = ''
-            self.selected_name_index = -1
-            return
-
-        self.selected_list = self.list_choices[found_index]
-        self.selected_list_index = found_index
-
-        #update name_choices
-        if item==self.SPECIAL_ALL:
-            self.name_choices = self.all_names_list.copy()
-        elif item==self.SPECIAL_NOTAG:
-            self.name_choices = self.get_uncategorized_names()
-        else:
-            self.name_choices = []
-            tag_data = self.tag_data.get(item,None)
-            if tag_data!=None:
-                for n in range(len(self.all_names_list)):
-                    name = self.all_names_list[n]
-                    if name in tag_data:
-                        self.name_choices.append(name)
-        self.select_name(None)
-
-    def select_name(self, item):
-        found_index = get_list_index(self.name_choices, item)
-        if found_index==-1:
-            self.selected_name = ''
-            self.selected_name_index = -1
-            return
-        self.selected_name = self.name_choices[found_index]
-        self.selected_name_index = found_index
-        if self.selected_list_index!=-1:
-            self.default_name_indexes[self.selected_list] = found_index
-
-    def get_default_template(self):
-        if len(self.template_choices)>0:
-            default_template = self.template_choices[0]
-        else:
-            default_template = ''
-        return default_template
-
-    def get_default_list(self):
-        if len(self.list_choices)>0:
-            default_list = self.list_choices[0]
-        else:
-            default_list = ''
-        return default_list
-
-    def get_default_name(self):
-        if self.selected_list_index==-1:
-            return ''
-        index = self.default_name_indexes.get(self.selected_list,-1)
-        if index==-1:
-            if len(self.name_choices)>0: index = 0
-        if (index<0) or (index>=len(self.name_choices)):
-            default_name = ''
-        else:
-            default_name=self.name_choices[index]
-        return default_name
-
-    def get_name_tags(self, name):
-        if name=='': return []
-        result = []
-        for n in range(len(self.tag_choices)):
-            tag_name = self.tag_choices[n]
-            tag_data = self.tag_data[tag_name]
-            if (name in tag_data):
-                result.append(tag_name)
-        return result
-
-    def set_name_tags(self, name, new_tags):
-        for n in range(len(self.tag_choices)):
-            tag_name = self.tag_choices[n]
-            tag_data = self.tag_data[tag_name]
-            old_checked = name in tag_data
-            new_checked = tag_name in new_tags
-            if (old_checked!=new_checked):
-                if new_checked:
-                    tag_data.append(name)
-                else:
-                    tag_data.remove(name)
-                tag_data.sort()
-                save_string_list(tag_data, path.join(self.tags_folder,tag_name+'.txt'),overwrite=True)
-
-    def get_uncategorized_names(self):
-        result = []
-        for n in range(len(self.all_names_list)):
-            name = self.all_names_list[n]
-            found = False
-            for i in range(len(self.tag_choices)):
-                tag_name = self.tag_choices[i]
-                tag_data = self.tag_data[tag_name]
-                if (name in tag_data):
-                    found = True
-                    break
-            if found==False:
-                result.append(name)
-        return result
-
-    def load_image(self, image_sub_folder, name):
-        name = name.strip().lower()
-        if (name=='') or (image_sub_folder==''): return None
-        result = None
-        image_files = self.image_files.get(image_sub_folder,None)
-        if image_files==None: return None
-        for file_name in image_files:
-            if name in file_name.lower():
-                image_path = path.join(self.images_folder,image_sub_folder,'')
-                image_fnam = path.join(image_path,file_name)
-                try:
-                    result = Image.open(image_fnam)
-                    break
-                except:
-                    print('warning: error loading ',image_fnam)
-        return result
-
-    def save_last_folders(self,folders):
-        save_string_list(folders, path.join(self.data_folder,'last_folders.txt'),overwrite=True)
-
-    def load_last_folders(self):
-        folders = load_string_list(path.join(self.data_folder,'last_folders.txt'),process=False,addempty=True)
-        num_folders = len(folders)
-        if (num_folders>0) and (num_folders<NUM_IMAGES):
-                folders = folders + ['']*(NUM_IMAGES-num_folders)
-        return folders
-
-    def get_assorted_images(self, name):
-        name = name.strip().lower()
-        if name=='':
-            return []
-        result = []
-        for file_name in self.assorted_images:
-            if name in file_name.lower():
-                image_fnam = path.join(self.assorted_folder,file_name)
-                img = None
-                try:
-                    img = Image.open(image_fnam)
-                except:
-                    img = None
-                    print('warning: error loading ',image_fnam)
-                if img!=None:
-                    result.append(img)
-        return result
-
-    def find_image_filename(self, image_sub_folder, name):
-        name = name.strip().lower()
-        if (name=='') or (image_sub_folder==''): return None
-        result = None
-        image_files = self.image_files.get(image_sub_folder,None)
-        if image_files==None: return None
-        for file_name in image_files:
-            if name in file_name.lower():
-                result = file_name
-                break
-        return result
-
-    def get_assorted_filenames(self, name):
-        name = name.strip().lower()
-        if name=='':
-            return []
-        result = []
-        for file_name in self.assorted_images:
-            if name in file_name.lower():
-                result.append(file_name)
-        return result
+NAME_PAGE_SIZE = 100 # names sent to the Name dropdown at once, the page holding the selected name, 0 = all names
+FIND_MAX_RESULTS = 100 # matches listed under Find
+# engine options are in lib_artist_util/engine.py, html options in lib_artist_util/export.py,
+# duplicate finder options in lib_artist_util/dupes.py, similar names options in lib_artist_util/similar.py,
+# file watcher options in lib_artist_util/watcher.py, grid view options in lib_artist_util/grid.py;
+# Reload UI only re-runs this script, restart the webui after changing those
 
 #-------------------------------------------------------------------------------
 # UI actions
 #-------------------------------------------------------------------------------
 
-def do_list_selector_change(new_selected_list):
-    au.select_list(new_selected_list)
-    au.select_name(au.get_default_name())
-    name_selector_update = gr.Dropdown.update(choices=au.name_choices, value=au.selected_name)
-    name_tags_update = gr.CheckboxGroup.update(value=au.get_name_tags(au.selected_name))
-    selected_name_update = au.selected_name
+def get_name_page(session):
+    # returns the names for the Name dropdown and its label
+    names, first, total = session.get_name_page(NAME_PAGE_SIZE)
+    if total==0:
+        label = 'Name (no matches)' if session.name_filter!='' else 'Name'
+    elif len(names)<total:
+        label = 'Name ('+str(first+1)+'-'+str(first+len(names))+' of '+str(total)+')'
+    else:
+        label = 'Name ('+str(total)+')' if session.name_filter!='' else 'Name'
+    return names, label
+
+def get_name_selector_update(session):
+    names, label = get_name_page(session)
+    return gr.Dropdown.update(choices=names,value=session.selected_name,label=label)
+
+def select_filtered_name(session):
+    # keeps the selected name among the names matching the filter
+    names = session.get_filtered_names()
+    if (len(names)>0) and (not session.selected_name in names):
+        session.select_name(names[0])
+
+@timed('do_list_selector_change')
+def do_list_selector_change(session,new_selected_list):
+    session.cancel_prefetch()
+    session.select_list(new_selected_list)
+    session.select_name(session.get_default_name())
+    select_filtered_name(session)
+    name_selector_update = get_name_selector_update(session)
+    name_tags_update = gr.CheckboxGroup.update(value=au.get_name_tags(session.selected_name))
+    selected_name_update = session.selected_name
     return [name_selector_update,name_tags_update,selected_name_update]
 
-def do_name_selector_change(new_selected_name):
-    au.select_name(new_selected_name)
-    name_tags_update = gr.CheckboxGroup.update(value=au.get_name_tags(au.selected_name))
-    selected_name_update = au.selected_name
+@timed('do_name_selector_change')
+def do_name_selector_change(session,new_selected_name):
+    session.select_name(new_selected_name)
+    name_tags_update = gr.CheckboxGroup.update(value=au.get_name_tags(session.selected_name))
+    selected_name_update = session.selected_name
     return [name_tags_update, selected_name_update]
 
-def do_prev_name_button_click():
-    cur_index = au.selected_name_index
-    prev_index = cur_index-1
-    if prev_index<0:
+@timed('do_name_filter_change')
+def do_name_filter_change(session,name_filter):
+    session.set_name_filter(name_filter)
+    select_filtered_name(session)
+    name_selector_update = get_name_selector_update(session)
+    name_tags_update = gr.CheckboxGroup.update(value=au.get_name_tags(session.selected_name))
+    selected_name_update = gr.Textbox.update(value=session.selected_name)
+    return [name_selector_update,name_tags_update,selected_name_update]
+
+@timed('do_prev_name_button_click')
+def do_prev_name_button_click(session):
+    prev_name = session.get_next_name(-1)
+    if prev_name==None:
         name_selector_update = gr.Dropdown.update()
         name_tags_update = gr.CheckboxGroup.update()
     else:
-        au.select_name(au.name_choices[prev_index])
-        name_selector_update = gr.Dropdown.update(value=au.selected_name)
-        name_tags_update = gr.CheckboxGroup.update(value=au.get_name_tags(au.selected_name))
-    selected_name_update = gr.Textbox.update(value=au.selected_name)
+        session.select_name(prev_name)
+        name_selector_update = get_name_selector_update(session)
+        name_tags_update = gr.CheckboxGroup.update(value=au.get_name_tags(session.selected_name))
+    selected_name_update = gr.Textbox.update(value=session.selected_name)
     return [name_selector_update,name_tags_update,selected_name_update]
 
-def do_next_name_button_click():
-    cur_index = au.selected_name_index
-    next_index = cur_index+1
-    if next_index>=len(au.name_choices):
+@timed('do_next_name_button_click')
+def do_next_name_button_click(session):
+    next_name = session.get_next_name(1)
+    if next_name==None:
         name_selector_update = gr.Dropdown.update()
         name_tags_update = gr.CheckboxGroup.update()
     else:
-        au.select_name(au.name_choices[next_index])
-        name_selector_update = gr.Dropdown.update(value=au.selected_name)
-        name_tags_update = gr.CheckboxGroup.update(value=au.get_name_tags(au.selected_name))
-    selected_name_update = gr.Textbox.update(value=au.selected_name)
+        session.select_name(next_name)
+        name_selector_update = get_name_selector_update(session)
+        name_tags_update = gr.CheckboxGroup.update(value=au.get_name_tags(session.selected_name))
+    selected_name_update = gr.Textbox.update(value=session.selected_name)
     return [name_selector_update,name_tags_update,selected_name_update]
 
-def do_name_tags_change(new_tags):
-    if au.selected_name_index==-1: return
-    au.set_name_tags(au.selected_name,new_tags)
+@timed('do_refresh_button_click')
+def do_refresh_button_click(session,*folders):
+    # the file watcher changes the engine's lists, this sends them to the UI
+    session.refresh_selection()
+    select_filtered_name(session)
+    list_selector_update = gr.Dropdown.update(choices=au.list_choices,value=session.selected_list)
+    name_selector_update = get_name_selector_update(session)
+    name_tags_update = gr.CheckboxGroup.update(choices=au.tag_choices,value=au.get_name_tags(session.selected_name))
+    tags_update = gr.CheckboxGroup.update(choices=au.tag_choices)
+    templates_update = gr.Dropdown.update(choices=au.template_choices)
+    extra_templates_update = gr.CheckboxGroup.update(choices=au.template_choices)
+    folder_updates = [gr.Dropdown.update(choices=['']+au.image_subfolder_choices) for x in folders]
+    return [list_selector_update,name_selector_update,name_tags_update,session.selected_name,tags_update,tags_update,tags_update,
+        templates_update,extra_templates_update]+folder_updates
+
+@timed('do_name_tags_change')
+def do_name_tags_change(session,new_tags):
+    if session.selected_name_index==-1: return
+    au.set_name_tags(session.selected_name,new_tags)
     return
 
-def do_find_first_button_click(search_text):
+@timed('do_bulk_tag_button_click')
+def do_bulk_tag_button_click(session, source, search_text, add_tags, remove_tags):
+    log = []
+    if source=='Find results':
+        # close matches don't contain the text, they are never bulk tagged
+        names = session.find_names(search_text,fuzzy=False)
+        log.append('Names: '+str(len(names))+' ('+source+', '+str(len(session.find_names(search_text))-len(names))+' close matches left out)')
+    else:
+        names = session.name_choices
+        log.append('Names: '+str(len(names))+' ('+source+')')
+    changes = au.bulk_tag_names(names, add_tags, remove_tags)
+    for tag_name in add_tags:
+        log.append('Added "'+tag_name+'" to '+str(changes.get(tag_name,0))+' names')
+    for tag_name in remove_tags:
+        log.append('Removed "'+tag_name+'" from '+str(changes.get(tag_name,0))+' names')
+    # the selected list may have gained or lost names
+    session.refresh_selection()
+    select_filtered_name(session)
+    name_selector_update = get_name_selector_update(session)
+    name_tags_update = gr.CheckboxGroup.update(value=au.get_name_tags(session.selected_name))
+    selected_name_update = gr.Textbox.update(value=session.selected_name)
+    return ['\n'.join(log), name_selector_update, name_tags_update, selected_name_update]
+
+def get_find_updates(session, search_text):
+    hits = session.find_names(search_text)
+    if len(hits)==0:
+        find_results_update = gr.Dropdown.update(choices=[],value='',label='No matches')
+    else:
+        position = ''
+        if session.selected_name in hits:
+            position = str(hits.index(session.selected_name)+1)+' / '
+        find_results_update = gr.Dropdown.update(choices=hits[:FIND_MAX_RESULTS],value=session.selected_name if session.selected_name in hits else '',
+            label='Matches: '+position+str(len(hits)))
+    return find_results_update
+
+@timed('do_find_first_button_click')
+def do_find_first_button_click(session, search_text):
     search_text = search_text.strip().lower()
     if search_text=='':
         name_selector_update = gr.Dropdown.update()
         name_tags_update = gr.CheckboxGroup.update()
     else:
-        found_name = None
-        for n in range(len(au.name_choices)):
-            name = au.name_choices[n]
-            if search_text in name:
-                found_name = name
-                break
+        hits = session.find_names(search_text)
+        found_name = hits[0] if len(hits)>0 else None
         if (found_name==None):
             name_selector_update = gr.Dropdown.update(value='')
             name_tags_update = gr.CheckboxGroup.update(value=[])
-        elif (found_name==au.selected_name):
+        elif (found_name==session.selected_name):
             name_selector_update = gr.Dropdown.update()
             name_tags_update = gr.CheckboxGroup.update()
         else:
-            au.select_name(found_name)
-            name_selector_update = gr.Dropdown.update(value=au.selected_name)
-            name_tags_update = gr.CheckboxGroup.update(value=au.get_name_tags(au.selected_name))
+            session.select_name(found_name)
+            name_selector_update = get_name_selector_update(session)
+            name_tags_update = gr.CheckboxGroup.update(value=au.get_name_tags(session.selected_name))
 
-    selected_name_update = gr.Textbox.update(value=au.selected_name)
-    return [name_selector_update,name_tags_update,selected_name_update]
+    selected_name_update = gr.Textbox.update(value=session.selected_name)
+    return [name_selector_update,name_tags_update,selected_name_update,get_find_updates(session,search_text)]
 
-def do_find_next_button_click(search_text):
+@timed('do_find_next_button_click')
+def do_find_next_button_click(session, search_text):
     search_text = search_text.strip().lower()
     if search_text=='':
         name_selector_update = gr.Dropdown.update()
         name_tags_update = gr.CheckboxGroup.update()
     else:
-        cur_index = au.selected_name_index
-        found_name = None
-        for n in range(cur_index+1,len(au.name_choices)):
-            name = au.name_choices[n]
-            if search_text in name:
-                found_name = name
-                break
-        if (found_name==None):
+        found_name = session.find_next_name(search_text)
+        if (found_name==None) or (found_name==session.selected_name):
             name_selector_update = gr.Dropdown.update()
             name_tags_update = gr.CheckboxGroup.update()
         else:
-            au.select_name(found_name)
-            name_selector_update = gr.Dropdown.update(value=au.selected_name)
-            name_tags_update = gr.CheckboxGroup.update(value=au.get_name_tags(au.selected_name))
-
-    selected_name_update = gr.Textbox.update(value=au.selected_name)
+            session.select_name(found_name)
+            name_selector_update = get_name_selector_update(session)
+            name_tags_update = gr.CheckboxGroup.update(value=au.get_name_tags(session.selected_name))
+
+    selected_name_update = gr.Textbox.update(value=session.selected_name)
+    return [name_selector_update,name_tags_update,selected_name_update,get_find_updates(session,search_text)]
+
+@timed('do_find_results_change')
+def do_find_results_change(session, found_name):
+    if (found_name=='') or (found_name==None) or (found_name==session.selected_name):
+        return [gr.Dropdown.update(),gr.CheckboxGroup.update(),gr.Textbox.update()]
+    session.select_name(found_name)
+    name_selector_update = get_name_selector_update(session)
+    name_tags_update = gr.CheckboxGroup.update(value=au.get_name_tags(session.selected_name))
+    selected_name_update = gr.Textbox.update(value=session.selected_name)
     return [name_selector_update,name_tags_update,selected_name_update]
 
-def do_save_button_click(template_text,prompt_text,skip_tags):
-    #prompt_text = prompt_text.lower()
-    results = []
-    log = []
-    log.append('Template: "'+template_text+'"')
-    log.append('Prompt: "'+prompt_text+'"')
-    log.append('List: "'+au.selected_list+'"')
-    num_skipped = 0
-    for n in range(len(au.name_choices)):
-        name = au.name_choices[n]
-        if len(skip_tags)>0:
-            name_tags = au.get_name_tags(name)
-            found = False
-            for tag_name in name_tags:
-                if tag_name in skip_tags:
-                    found = True
-                    break
-            if found:
-                num_skipped+=1
-                continue
-        text = template_text.replace('NAME',name).replace('PROMPT',prompt_text)
-        text = text.replace('NAME',name)
-        results.append(text)
-    if len(skip_tags)>0:
-        log.append('List contains '+str(len(au.name_choices))+' names')
-        log.append('Skip tags: '+str(skip_tags))
-        log.append('Skipped '+str(num_skipped)+' names')
-
-    log.append('Generated prompts for '+str(len(results))+' names')
-    if len(results)>0:
-        full_path = path.join(BASE_FOLDER,'output.txt')
-        try:
-            save_string_list(results, full_path,True)
-            log.append('Saved '+full_path)
-        except Exception as e:
-            log.append('Error: could not save '+full_path+'\n'+str(e))
-    log_text = '\n'.join(log)
-    return log_text
-
-def do_selected_name_change(selected_name,*folder_selectors):
-    folder_images = []
-    for n in range(len(folder_selectors)):
-        folder = folder_selectors[n]
-        img = au.load_image(folder, selected_name)
-        folder_images.append(img)
+@timed('do_save_button_click')
+def do_save_button_click(session,template_text,prompt_text,skip_tags,include_text='',extra_templates=[],prompt_per_line=False,num_shards=1,sample_rate=1.0,seed=0):
+    return export_prompts(au,session.name_choices,session.selected_list,BASE_FOLDER,template_text,prompt_text,skip_tags,include_text,extra_templates,prompt_per_line,num_shards,sample_rate,seed)
+
+@timed('do_catalog_import_button_click')
+def do_catalog_import_button_click():
+    if au.catalog==None: return 'Catalog is not enabled (USE_CATALOG in lib_artist_util/engine.py)'
+    au.flush_tags()
+    try:
+        num_names, num_tags = au.catalog.import_text(au.data_folder)
+    except Exception as e:
+        return 'Error: could not import into '+au.catalog.db_fnam+'\n'+str(e)
+    return 'Imported '+str(num_names)+' names and '+str(num_tags)+' tags into '+au.catalog.db_fnam+'\nclick "Reload UI" to use them'
+
+@timed('do_catalog_export_button_click')
+def do_catalog_export_button_click():
+    if au.catalog==None: return 'Catalog is not enabled (USE_CATALOG in lib_artist_util/engine.py)'
+    au.flush_tags()
+    try:
+        num_names, num_tags = au.catalog.export_text(au.data_folder)
+    except Exception as e:
+        return 'Error: could not export to '+au.data_folder+'\n'+str(e)
+    return 'Exported '+str(num_names)+' names and '+str(num_tags)+' tags to '+au.data_folder
+
+def get_gallery_images(images):
+    # a single contact sheet is one transfer instead of one per image
+    if (ASSORTED_SHEET==True) and (len(images)>1):
+        sheet, tiles = compose_sheet(images,ASSORTED_SHEET_SIZE,ASSORTED_SHEET_COLUMNS)
+        return [sheet]
+    return images
+
+@timed('do_selected_name_change')
+def do_selected_name_change(session,selected_name,*folder_selectors):
+    folder_images, assorted_images = au.load_panel_images(folder_selectors, selected_name, add_assorted=SHOW_ASSORTED)
     if SHOW_ASSORTED==True:
-        assorted_images= au.get_assorted_images(selected_name)
-        assorted_gallery_update = gr.Gallery.update(value=assorted_images)
+        assorted_gallery_update = gr.Gallery.update(value=get_gallery_images(assorted_images))
     else:
         assorted_gallery_update = gr.Gallery.update()
+    session.prefetch_images(folder_selectors)
     total_result = [assorted_gallery_update]+folder_images
     if len(total_result)==1:
         total_result = total_result[0]
     return total_result
 
-def do_folder_selector_change(selected_name,selected_folder, *all_folders):
+@timed('do_folder_selector_change')
+def do_folder_selector_change(session,selected_name,selected_folder, *all_folders):
+    session.cancel_prefetch()
     img=au.load_image(selected_folder, selected_name)
     au.save_last_folders(all_folders)
+    session.prefetch_images(all_folders)
     return img
 
-def do_save_html(*image_folders):
-    r = []
-    r.append('<html>')
-    r.append('<head></head>')
-    r.append('<body>')
-
-    r.append('<table border='+HTML_BORDER_STR+'>')
-    r.append('  <tr>')
-
-    if HTML_ADD_INDEX==True:
-        r.append('    <th></th>')
-    r.append('    <th>Name</th>')
-    for f in range(len(image_folders)):
-        folder = image_folders[f]
-        if folder=='': continue
-        r.append('    <th>'+folder+'</th>')
-    if HTML_ADD_TAGS==True:
-        r.append('    <th>Tags</th>')
-
-    if HTML_ADD_ASSORTED==True:
-        r.append('    <th>Other</th>')
-
-    r.append('  </tr>')
-
-    for n in range(len(au.name_choices)):
-        r.append('  <tr>')
-        name = au.name_choices[n]
-        if HTML_ADD_INDEX==True:
-            r.append('    <td>'+str(n)+'</td>')
-        r.append('    <td>'+name+'</td>')
-
-        for f in range(len(image_folders)):
-            folder = image_folders[f]
-            if folder=='': continue
-            img_name = au.find_image_filename(folder,name)
-            if img_name==None:
-                r.append('    <td></td>')
-            else:
-                img_path = 'data/images/'+folder+'/'+img_name
-                r.append('    <td>'+'<img src="'+img_path+
-                    '" width='+HTML_WIDTH_STR+', height='+HTML_HEIGHT_STR+'>'+'</td>')
-
-        if HTML_ADD_TAGS==True:
-            tag_list = au.get_name_tags(name)
-            tag_str = str(tag_list)
-            r.append('    <td>'+tag_str+'</td>')
-
-        if HTML_ADD_ASSORTED==True:
-
-            files = au.get_assorted_filenames(name)
-            all_files = []
-            for file in files:
-                file_path = 'data/assorted/'+file
-                all_files.append('<img src="'+file_path+
-                '" width='+HTML_WIDTH_STR+', height='+HTML_HEIGHT_STR+'>')
-            total_str=''.join(all_files)
-            r.append('    <td>'+total_str+'</td>')
-
-        r.append('  </tr>')
-    r.append('</table>')
-    r.append('</body>')
-    r.append('</html>')
-
-    log = []
-    full_path = path.join(BASE_FOLDER,'html_output.html')
+@timed('do_save_html')
+def do_save_html(session,*image_folders):
+    return export_html(au,session.name_choices,image_folders,BASE_FOLDER)
+
+def get_shown_folders(folders):
+    # the folders shown in the panels, or all folders if none are selected
+    folders = [x for x in dict.fromkeys(folders) if x!='']
+    return folders if len(folders)>0 else au.image_subfolder_choices
+
+@timed('do_coverage_button_click')
+def do_coverage_button_click(session,*folders):
+    return get_coverage_log(au,session.name_choices,session.selected_list,get_shown_folders(folders))
+
+@timed('do_coverage_save_button_click')
+def do_coverage_save_button_click(session,missing_in,template_text,prompt_text,skip_tags,include_text,extra_templates,prompt_per_line,num_shards,sample_rate,seed,*folders):
+    folders = get_shown_folders(folders)
+    au.coverage.update()
+    names = au.coverage.get_missing_names(session.name_choices,folders,missing_all=(missing_in=='All folders'))
+    list_name = session.selected_list+' (missing in '+missing_in.lower()+': '+', '.join(folders)+')'
+    return export_prompts(au,names,list_name,BASE_FOLDER,template_text,prompt_text,skip_tags,include_text,extra_templates,prompt_per_line,num_shards,sample_rate,seed)
+
+def get_hash_index():
+    # hashes are loaded on first use, and kept until the engine is rebuilt
+    global hash_index
+    with index_lock:
+        if (hash_index==None) or (hash_index.au!=au):
+            hash_index = AuHashIndex(au)
+        return hash_index
+
+@timed('do_duplicates_find_button_click')
+def do_duplicates_find_button_click(max_dist):
+    return get_duplicates_log(get_hash_index(),int(max_dist))
+
+@timed('do_duplicates_name_button_click')
+def do_duplicates_name_button_click(session,max_dist):
+    return get_name_duplicates_log(get_hash_index(),session.selected_name,int(max_dist))
+
+@timed('do_duplicates_report_button_click')
+def do_duplicates_report_button_click(max_dist):
+    return get_duplicates_log(get_hash_index(),int(max_dist),path.join(BASE_FOLDER,'duplicates.json'))
+
+def get_similar_index():
+    global similar_index
+    with index_lock:
+        if (similar_index==None) or (similar_index.au!=au):
+            similar_index = AuSimilarIndex(au)
+        return similar_index
+
+@timed('do_similar_button_click')
+def do_similar_button_click(session,*folders):
+    similar_names = get_similar_index().find_similar(session.selected_name,folders,candidates=session.name_choices)
+    similar_results_update = gr.Dropdown.update(choices=[name for score, name in similar_names],value=None)
+    return [similar_results_update,get_similar_log(session.selected_name,folders,similar_names)]
+
+@timed('do_suggest_tags_button_click')
+def do_suggest_tags_button_click(session,*folders):
+    suggestions = get_similar_index().suggest_tags(session.name_choices,folders)
+    return save_tag_suggestions(suggestions,session.selected_list,len(session.name_choices),path.join(BASE_FOLDER,'tag_suggestions.txt'))
+
+def get_grid():
+    global grid_view
+    with index_lock:
+        if (grid_view==None) or (grid_view.au!=au):
+            grid_view = AuGrid(au)
+        return grid_view
+
+def show_grid_page(session, page, step, folders):
+    # page is 1 based in the UI; the filtered names of the list are shown
+    page = int(page)+step if page!=None else 1
+    names = session.get_filtered_names()
+    folders = get_shown_folders(folders)
+    grid, page = get_grid().get_page(session.selected_list+'\n'+session.name_filter,names,page-1,folders)
+    log = 'Page '+str(page+1)+' / '+str(get_num_pages(len(names)))+', '+str(len(names))+' names, folders: '+', '.join(folders)
+    return [gr.Number.update(value=page+1),grid,log]
+
+@timed('do_grid_button_click')
+def do_grid_button_click(session,*folders):
+    names = session.get_filtered_names()
+    index = names.index(session.selected_name) if session.selected_name in names else 0
+    return show_grid_page(session,index//max(1,GRID_NAMES)+1,0,folders)
+
+@timed('do_grid_page_submit')
+def do_grid_page_submit(session,page,*folders):
+    return show_grid_page(session,page,0,folders)
+
+@timed('do_grid_prev_button_click')
+def do_grid_prev_button_click(session,page,*folders):
+    return show_grid_page(session,page,-1,folders)
+
+@timed('do_grid_next_button_click')
+def do_grid_next_button_click(session,page,*folders):
+    return show_grid_page(session,page,1,folders)
+
+def do_stats_refresh_button_click():
+    return stats.get_json()
+
+def do_stats_save_button_click():
+    full_path = path.join(BASE_FOLDER,'stats.json')
     try:
-        save_string_list(r,full_path,overwrite=True)
-        log.append('Saved '+full_path)
+        save_string_list([stats.get_json()],full_path,overwrite=True)
     except Exception as e:
-        log.append('Error: could not save '+full_path+'\n'+str(e))
-
-    log_text = '\n'.join(log)
-    return log_text
+        return 'Error: could not save '+full_path+'\n'+str(e)
+    return 'Saved '+full_path
+
+def print_startup_stats(engine_time, ui_time):
+    report = stats.get_report()
+    counters = report['counters']
+    lines = ['Artist-Util startup: engine '+'%.3f' % engine_time+'s, ui '+'%.3f' % ui_time+'s']
+    for name in ['engine.scan_folders','engine.load_data','engine.build_index']:
+        timing = report['timings'].get(name,None)
+        if timing!=None:
+            lines.append('  '+name+': '+str(timing['total_ms'])+' ms')
+    lines.append('  scans: '+str(counters.get('scans',0))+', file reads: '+str(counters.get('file_reads',0))+
+        ', image decodes: '+str(counters.get('image_decodes',0))+', thumbnail hits/misses: '+
+        str(counters.get('thumbnail_hits',0))+'/'+str(counters.get('thumbnail_misses',0)))
+    print('\n'.join(lines))
 
 #-------------------------------------------------------------------------------
 # Create UI
 #-------------------------------------------------------------------------------
 
 au : AuEngine = None
+hash_index : AuHashIndex = None
+similar_index : AuSimilarIndex = None
+grid_view : AuGrid = None
+index_lock = threading.Lock() # handlers run concurrently, the indexes are made once
+au_watcher : AuWatcher = None
 
 def add_tab():
 
     if not path.exists(BASE_FOLDER):
         print('Error: base folder does not exist '+BASE_FOLDER)
         raise
-    global au
-    au = AuEngine(DATA_FOLDER)
+    global au, gr, au_watcher
+    import gradio as gr
+    if au_watcher!=None:
+        au_watcher.stop()
+        au_watcher = None
+    if au!=None:
+        au.flush_tags()
+    start_time = time.perf_counter()
+    au = AuEngine(DATA_FOLDER,load_assorted=(SHOW_ASSORTED==True) or (export.HTML_ADD_ASSORTED==True))
+    engine_time = time.perf_counter()-start_time
+    if watcher.WATCH_FILES==True:
+        au_watcher = AuWatcher(au)
+        au_watcher.start()
+
+    # each browser session gets its own copy of this, see AuSession
+    session = AuSession(au)
 
     with gr.Blocks(analytics_enabled=False) as ui:
+        session_state = gr.State(value=session)
         with gr.Row():
 
             with gr.Column(scale=1):
                 with gr.Row():
-                    au.select_list(au.get_default_list())
-                    list_selector = gr.Dropdown(label='Browse', choices=au.list_choices, value=au.selected_list)
+                    session.select_list(au.get_default_list())
+                    list_selector = gr.Dropdown(label='Browse', choices=au.list_choices, value=session.selected_list)
 
                 with gr.Row():
-                    au.select_name(au.get_default_name())
-                    name_selector = gr.Dropdown(label='Name', choices=au.name_choices, value=au.selected_name)
+                    session.select_name(session.get_default_name())
+                    names, label = get_name_page(session)
+                    name_selector = gr.Dropdown(label=label, choices=names, value=session.selected_name)
+                with gr.Row():
+                    name_filter = gr.Textbox(label='Filter names',lines=1,max_lines=1)
 
                 with gr.Row():
                     prev_name_button = gr.Button(value='prev')
                     next_name_button = gr.Button(value='next')
+                    refresh_button = gr.Button(value='refresh')
 
 
             with gr.Column(scale=2):
                     with gr.Accordion(label='Categorize',open=True):
                         with gr.Row():
-                            selected_name = gr.Textbox(value=au.selected_name,label='Selected Name',show_label=False,lines=1,max_lines=1,interactive=False)
+                            selected_name = gr.Textbox(value=session.selected_name,label='Selected Name',show_label=False,lines=1,max_lines=1,interactive=False)
                         with gr.Row():
-                            name_tags = gr.CheckboxGroup(label='Tags',choices=au.tag_choices,value=au.get_name_tags(au.selected_name))
+                            name_tags = gr.CheckboxGroup(label='Tags',choices=au.tag_choices,value=au.get_name_tags(session.selected_name))
+
+                    with gr.Accordion(label='Bulk tag',open=False):
+                        with gr.Row():
+                            bulk_source = gr.Radio(label='Names',choices=['Current list','Find results'],value='Current list')
+                        with gr.Row():
+                            bulk_add_tags = gr.CheckboxGroup(label='Add tags',choices=au.tag_choices)
+                        with gr.Row():
+                            bulk_remove_tags = gr.CheckboxGroup(label='Remove tags',choices=au.tag_choices)
+                        with gr.Row():
+                            bulk_button = gr.Button(value='Apply')
+                        with gr.Row():
+                            bulk_log = gr.Textbox(label='Log',lines=2,interactive=False)
 
             with gr.Column(scale=1):
 
@@ -605,6 +491,17 @@ def add_tab():
                     with gr.Row():
                         find_first_button = gr.Button(value='first')
                         find_next_button = gr.Button(value='next')
+                    with gr.Row():
+                        find_results = gr.Dropdown(label='Matches',choices=[])
+
+                with gr.Accordion(label='Similar',open=False):
+                    with gr.Row():
+                        similar_button = gr.Button(value='Find similar')
+                        suggest_tags_button = gr.Button(value='Suggest tags for list')
+                    with gr.Row():
+                        similar_results = gr.Dropdown(label='Similar names',choices=[])
+                    with gr.Row():
+                        similar_log = gr.Textbox(label='Log',lines=4,interactive=False)
 
             with gr.Column(scale=1):
 
@@ -619,23 +516,71 @@ def add_tab():
                         with gr.Accordion(label='Skip',open=False):
                             skip_tags = gr.CheckboxGroup(label='Tags',choices=au.tag_choices)
 
+                    with gr.Row():
+                        with gr.Accordion(label='Include',open=False):
+                            include_text = gr.Textbox(label='Tags (e.g. favorite and (digital or "oil painting") and not comic)',lines=1,max_lines=1)
+
+                    with gr.Row():
+                        with gr.Accordion(label='Batch',open=False):
+                            with gr.Row():
+                                extra_templates = gr.CheckboxGroup(label='Also use templates',choices=au.template_choices)
+                            with gr.Row():
+                                prompt_per_line = gr.Checkbox(label='One prompt per line',value=False)
+                            with gr.Row():
+                                num_shards = gr.Number(label='Files',value=1,precision=0)
+                                sample_rate = gr.Slider(label='Sample rate',minimum=0,maximum=1,step=0.01,value=1)
+                                sample_seed = gr.Number(label='Seed',value=0,precision=0)
+
                     with gr.Row():
                         save_button = gr.Button(value='Save TXT')
                     with gr.Row():
                         log_text = gr.Textbox(label='Log',lines=2,interactive=False)
 
+                with gr.Accordion(label='Coverage',open=False):
+                    with gr.Row():
+                        coverage_missing_in = gr.Radio(label='Missing in (shown folders, or all if none)',choices=['Any folder','All folders'],value='Any folder')
+                    with gr.Row():
+                        coverage_button = gr.Button('Show coverage')
+                        coverage_save_button = gr.Button('Save TXT for missing')
+                    with gr.Row():
+                        coverage_log = gr.Textbox(label='Log',lines=4,interactive=False)
+
                 with gr.Accordion(label='Export HTML',open=False):
                     with gr.Row():
                         html_button = gr.Button('Save HTML')
                     with gr.Row():
                         html_log = gr.Textbox(label='Log',lines=2,interactive=False)
 
+                with gr.Accordion(label='Duplicates',open=False):
+                    with gr.Row():
+                        duplicates_distance = gr.Slider(label='Max distance',minimum=0,maximum=16,step=1,value=dupes.DUPLICATE_MAX_DISTANCE)
+                    with gr.Row():
+                        duplicates_find_button = gr.Button('Find all')
+                        duplicates_name_button = gr.Button('Selected name')
+                        duplicates_report_button = gr.Button('Save JSON')
+                    with gr.Row():
+                        duplicates_log = gr.Textbox(label='Log',lines=4,interactive=False)
+
+                with gr.Accordion(label='Catalog',open=False,visible=au.catalog!=None):
+                    with gr.Row():
+                        catalog_import_button = gr.Button('Import text files')
+                        catalog_export_button = gr.Button('Export text files')
+                    with gr.Row():
+                        catalog_log = gr.Textbox(label='Log',lines=2,interactive=False)
+
+                with gr.Accordion(label='Stats',open=False,visible=stats.enabled):
+                    with gr.Row():
+                        stats_refresh_button = gr.Button('Refresh')
+                        stats_save_button = gr.Button('Save JSON')
+                    with gr.Row():
+                        stats_text = gr.Textbox(label='Stats',lines=8,interactive=False)
+
         with gr.Row():
 
             def add_assorted():
                 if SHOW_ASSORTED==True:
                     with gr.Column(scale=1):
-                        assorted_images= au.get_assorted_images(au.selected_name)
+                        assorted_images= get_gallery_images(au.get_assorted_images(session.selected_name))
                         assorted_gallery = gr.Gallery(label='Assorted', show_label=False, value =assorted_images)
                 else:
                     assorted_gallery = gr.Gallery(visible=False)
@@ -646,7 +591,7 @@ def add_tab():
                 folder_images=[]
                 NUM_IMAGE_ROWS = NUM_IMAGES//IMAGE_PER_ROW
                 if IMAGE_PER_ROW*NUM_IMAGE_ROWS < NUM_IMAGES: NUM_IMAGE_ROWS+=1
-                last_folders = au.load_last_folders()
+                last_folders = au.load_last_folders(NUM_IMAGES)
                 with gr.Column(scale=IMAGE_PER_ROW):
                     for row_no in range(NUM_IMAGE_ROWS):
                         with gr.Row():
@@ -660,7 +605,7 @@ def add_tab():
                                                 folder = last_folders[image_no]
                                                 if not folder in au.image_subfolder_choices: folder = ''
                                             with gr.Row():
-                                                img = au.load_image(folder,au.selected_name)
+                                                img = au.load_image(folder,session.selected_name)
                                                 fi = gr.Image(show_label=False, interactive=False, value=img)
                                                 folder_images.append(fi)
                                             with gr.Row():
@@ -676,25 +621,71 @@ def add_tab():
                 assorted_gallery = add_assorted()
                 folder_selectors, folder_images = add_image_folders()
 
+        with gr.Row():
+            with gr.Accordion(label='Grid',open=False):
+                with gr.Row():
+                    grid_button = gr.Button('Show page of selected name')
+                    grid_prev_button = gr.Button('prev page')
+                    grid_next_button = gr.Button('next page')
+                    grid_page = gr.Number(label='Page',value=1,precision=0)
+                with gr.Row():
+                    grid_log = gr.Textbox(show_label=False,lines=1,max_lines=1,interactive=False)
+                with gr.Row():
+                    grid_image = gr.Image(show_label=False,interactive=False)
+
         # actions
-        list_selector.change(fn=do_list_selector_change,inputs=list_selector,outputs=[name_selector,name_tags,selected_name])
-        name_selector.change(fn=do_name_selector_change,inputs=name_selector,outputs=[name_tags,selected_name])
-        prev_name_button.click(fn=do_prev_name_button_click,outputs=[name_selector,name_tags,selected_name])
-        next_name_button.click(fn=do_next_name_button_click,outputs=[name_selector,name_tags,selected_name])
-        name_tags.change(fn=do_name_tags_change,inputs=name_tags)
-        find_first_button.click(fn=do_find_first_button_click,inputs=search_text,outputs=[name_selector,name_tags,selected_name])
-        find_next_button.click(fn=do_find_next_button_click,inputs=search_text,outputs=[name_selector,name_tags,selected_name])
-        save_button.click(fn=do_save_button_click,inputs=[template_selector,prompt_text,skip_tags],outputs=log_text)
-        html_button.click(fn=do_save_html,inputs=folder_selectors, outputs=html_log)
-
-        selected_name.change(fn=do_selected_name_change,inputs=[selected_name]+folder_selectors,outputs=[assorted_gallery]+folder_images)
+        list_selector.change(fn=do_list_selector_change,inputs=[session_state,list_selector],outputs=[name_selector,name_tags,selected_name])
+        name_selector.change(fn=do_name_selector_change,inputs=[session_state,name_selector],outputs=[name_tags,selected_name])
+        name_filter.change(fn=do_name_filter_change,inputs=[session_state,name_filter],outputs=[name_selector,name_tags,selected_name])
+        prev_name_button.click(fn=do_prev_name_button_click,inputs=session_state,outputs=[name_selector,name_tags,selected_name])
+        next_name_button.click(fn=do_next_name_button_click,inputs=session_state,outputs=[name_selector,name_tags,selected_name])
+        name_tags.change(fn=do_name_tags_change,inputs=[session_state,name_tags])
+        refresh_button.click(fn=do_refresh_button_click,inputs=[session_state]+folder_selectors,outputs=[list_selector,name_selector,name_tags,selected_name,
+            bulk_add_tags,bulk_remove_tags,skip_tags,template_selector,extra_templates]+folder_selectors)
+        bulk_button.click(fn=do_bulk_tag_button_click,inputs=[session_state,bulk_source,search_text,bulk_add_tags,bulk_remove_tags],outputs=[bulk_log,name_selector,name_tags,selected_name])
+        find_first_button.click(fn=do_find_first_button_click,inputs=[session_state,search_text],outputs=[name_selector,name_tags,selected_name,find_results])
+        find_next_button.click(fn=do_find_next_button_click,inputs=[session_state,search_text],outputs=[name_selector,name_tags,selected_name,find_results])
+        find_results.change(fn=do_find_results_change,inputs=[session_state,find_results],outputs=[name_selector,name_tags,selected_name])
+        similar_button.click(fn=do_similar_button_click,inputs=[session_state]+folder_selectors,outputs=[similar_results,similar_log])
+        similar_results.change(fn=do_find_results_change,inputs=[session_state,similar_results],outputs=[name_selector,name_tags,selected_name])
+        suggest_tags_button.click(fn=do_suggest_tags_button_click,inputs=[session_state]+folder_selectors,outputs=similar_log)
+        save_button.click(fn=do_save_button_click,inputs=[session_state,template_selector,prompt_text,skip_tags,include_text,extra_templates,prompt_per_line,num_shards,sample_rate,sample_seed],outputs=log_text)
+        html_button.click(fn=do_save_html,inputs=[session_state]+folder_selectors, outputs=html_log)
+        coverage_button.click(fn=do_coverage_button_click,inputs=[session_state]+folder_selectors,outputs=coverage_log)
+        coverage_save_button.click(fn=do_coverage_save_button_click,inputs=[session_state,coverage_missing_in,template_selector,prompt_text,skip_tags,include_text,extra_templates,
+            prompt_per_line,num_shards,sample_rate,sample_seed]+folder_selectors,outputs=coverage_log)
+        duplicates_find_button.click(fn=do_duplicates_find_button_click,inputs=duplicates_distance,outputs=duplicates_log)
+        duplicates_name_button.click(fn=do_duplicates_name_button_click,inputs=[session_state,duplicates_distance],outputs=duplicates_log)
+        duplicates_report_button.click(fn=do_duplicates_report_button_click,inputs=duplicates_distance,outputs=duplicates_log)
+        catalog_import_button.click(fn=do_catalog_import_button_click,outputs=catalog_log)
+        catalog_export_button.click(fn=do_catalog_export_button_click,outputs=catalog_log)
+        stats_refresh_button.click(fn=do_stats_refresh_button_click,outputs=stats_text)
+        stats_save_button.click(fn=do_stats_save_button_click,outputs=stats_text)
+        grid_button.click(fn=do_grid_button_click,inputs=[session_state]+folder_selectors,outputs=[grid_page,grid_image,grid_log])
+        grid_page.submit(fn=do_grid_page_submit,inputs=[session_state,grid_page]+folder_selectors,outputs=[grid_page,grid_image,grid_log])
+        grid_prev_button.click(fn=do_grid_prev_button_click,inputs=[session_state,grid_page]+folder_selectors,outputs=[grid_page,grid_image,grid_log])
+        grid_next_button.click(fn=do_grid_next_button_click,inputs=[session_state,grid_page]+folder_selectors,outputs=[grid_page,grid_image,grid_log])
+
+        selected_name.change(fn=do_selected_name_change,inputs=[session_state,selected_name]+folder_selectors,outputs=[assorted_gallery]+folder_images)
         for n in range(len(folder_selectors)):
             folder_selector=folder_selectors[n]
-            folder_selector.change(fn=do_folder_selector_change,inputs=[selected_name,folder_selector]+folder_selectors,outputs=folder_images[n])
+            folder_selector.change(fn=do_folder_selector_change,inputs=[session_state,selected_name,folder_selector]+folder_selectors,outputs=folder_images[n])
+
+    if stats.enabled:
+        print_startup_stats(engine_time,time.perf_counter()-start_time-engine_time)
 
     return [(ui, "Artist-Util", "artist_util")]
 
+def flush_on_exit():
+    if au_watcher!=None:
+        au_watcher.stop()
+    if au!=None:
+        au.flush_tags()
+
 on_ui_tabs(add_tab)
+if on_script_unloaded!=None:
+    on_script_unloaded(flush_on_exit) # Reload UI
+atexit.register(flush_on_exit)
 
 #-------------------------------------------------------------------------------
 
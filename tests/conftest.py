@@ -0,0 +1,10 @@
+# Artist-Util tests: shared setup
+
+import sys
+from os import path
+
+BASE_FOLDER = path.dirname(path.dirname(path.abspath(__file__)))
+
+# the tests import lib_artist_util from the extension folder
+if not BASE_FOLDER in sys.path:
+    sys.path.insert(0,BASE_FOLDER)
@@ -0,0 +1,30 @@
+# AuHammingIndex.find against comparing every hash
+
+import random
+
+from lib_artist_util.dupes import AuHammingIndex, get_hamming_distance
+
+def find_all(values, value, max_dist):
+    result = [(get_hamming_distance(value,x),x) for x in values]
+    return sorted(x for x in result if x[0]<=max_dist)
+
+def random_near(rnd, value, max_flips):
+    for n in range(rnd.randint(0,max_flips)):
+        value ^= 1<<rnd.randrange(64)
+    return value
+
+def test_find():
+    rnd = random.Random(1)
+    bases = [rnd.getrandbits(64) for x in range(20)]
+    values = set()
+    index = AuHammingIndex()
+    for n in range(4):
+        # values added after a find go into the buckets built so far
+        for m in range(500):
+            value = random_near(rnd,rnd.choice(bases),12) if rnd.random()<0.8 else rnd.getrandbits(64)
+            values.add(value)
+            index.add(value)
+        for max_dist in [0,1,2,4,6,8,12,16]:
+            for m in range(20):
+                value = random_near(rnd,rnd.choice(bases),max_dist+2)
+                assert sorted(index.find(value,max_dist))==find_all(values,value,max_dist)
@@ -0,0 +1,85 @@
+# AuNameMatcher and the image index against plain substring checks
+
+import random
+from os import path, makedirs, remove
+
+from lib_artist_util import engine
+from lib_artist_util.engine import AuEngine, AuNameMatcher
+
+def random_names(rnd, count):
+    # few letters, so names overlap and contain each other
+    names = set()
+    while len(names)<count:
+        words = [''.join(rnd.choice('abc') for x in range(rnd.randint(1,4))) for y in range(rnd.randint(1,2))]
+        names.add(' '.join(words))
+    return sorted(names)
+
+def random_file_names(rnd, names, count):
+    file_names = set()
+    while len(file_names)<count:
+        text = rnd.choice(names) if rnd.random()<0.7 else ''
+        if rnd.random()<0.5: text = text.upper()
+        file_names.add(str(rnd.randint(0,999)).zfill(3)+'-'+''.join(rnd.choice('abc ') for x in range(rnd.randint(0,3)))+text+'.png')
+    return sorted(file_names)
+
+def get_first_files(names, file_names):
+    # the first file, in sorted order, containing each name
+    result = {}
+    for name in names:
+        for file_name in sorted(file_names):
+            if name in file_name.lower():
+                result[name] = file_name
+                break
+    return result
+
+def make_data_folder(folder, names, file_names):
+    makedirs(path.join(folder,'tags'))
+    makedirs(path.join(folder,'images','folder1'))
+    with open(path.join(folder,'names.txt'),'w',encoding='utf-8') as f:
+        f.write('\n'.join(names))
+    for file_name in file_names:
+        open(path.join(folder,'images','folder1',file_name),'w').close()
+    return path.join(folder,'')
+
+def test_find_all():
+    rnd = random.Random(1)
+    for n in range(20):
+        names = random_names(rnd,30)
+        matcher = AuNameMatcher(names)
+        for m in range(50):
+            text = ''.join(rnd.choice('abc ') for x in range(rnd.randint(0,20)))
+            assert matcher.find_all(text)==set(x for x in names if x in text)
+
+def test_image_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(engine,'PREFETCH_NAMES',0)
+    monkeypatch.setattr(engine,'THUMBNAIL_DISK_CACHE',False)
+    rnd = random.Random(2)
+    names = random_names(rnd,40)
+    file_names = random_file_names(rnd,names,200)
+    au = AuEngine(make_data_folder(str(tmp_path),names,file_names))
+    for name in names:
+        assert au.find_image_filename('folder1',name)==get_first_files(names,file_names).get(name,None)
+
+def test_update_image_file_names(tmp_path, monkeypatch):
+    # files added and removed one by one give the index of a full scan
+    monkeypatch.setattr(engine,'PREFETCH_NAMES',0)
+    monkeypatch.setattr(engine,'THUMBNAIL_DISK_CACHE',False)
+    rnd = random.Random(3)
+    names = random_names(rnd,40)
+    file_names = random_file_names(rnd,names,200)
+    au = AuEngine(make_data_folder(str(tmp_path),names,file_names))
+    au.get_image_files('folder1')
+    files = set(file_names)
+    new_file_names = random_file_names(rnd,names,300)
+    for n in range(200):
+        if rnd.random()<0.5:
+            file_name = rnd.choice(sorted(files))
+            remove(path.join(str(tmp_path),'images','folder1',file_name))
+            files.remove(file_name)
+        else:
+            file_name = new_file_names[n]
+            open(path.join(str(tmp_path),'images','folder1',file_name),'w').close()
+            files.add(file_name)
+        au.update_image_file_names('folder1',[file_name])
+    assert au.image_files['folder1']==sorted(files)
+    assert au.image_index['folder1']==get_first_files(names,files)
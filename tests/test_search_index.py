@@ -0,0 +1,59 @@
+# AuSearchIndex.search against ranking every name one by one
+
+import random
+
+from lib_artist_util.engine import AuSearchIndex, get_substring_distance
+
+def search_all(query, name_choices):
+    query = ' '.join(query.strip().lower().split())
+    if query=='': return []
+    max_edits = AuSearchIndex.get_max_edits(None,query)
+    result = []
+    for n in range(len(name_choices)):
+        name = name_choices[n]
+        if name==query:
+            rank = AuSearchIndex.RANK_EXACT
+        elif name.startswith(query):
+            rank = AuSearchIndex.RANK_PREFIX
+        elif (' '+name).find(' '+query)!=-1:
+            rank = AuSearchIndex.RANK_WORD_PREFIX
+        elif query in name:
+            rank = AuSearchIndex.RANK_SUBSTRING
+        elif (len(query)>=3) and (get_substring_distance(query,name,max_edits)<=max_edits):
+            rank = AuSearchIndex.RANK_FUZZY+get_substring_distance(query,name,max_edits)
+        else:
+            continue
+        result.append((rank,n,name))
+    return [(rank,name) for rank, n, name in sorted(result)]
+
+def random_query(rnd, names):
+    if rnd.random()<0.2:
+        return ''.join(rnd.choice('abcd ') for x in range(rnd.randint(0,10)))
+    name = rnd.choice(names)
+    first = rnd.randint(0,len(name)-1)
+    query = list(name[first:first+rnd.randint(1,12)])
+    for n in range(rnd.randint(0,2)):
+        pos = rnd.randint(0,len(query))
+        edit = rnd.choice(['insert','delete','replace'])
+        if edit=='insert':
+            query.insert(pos,rnd.choice('abcd'))
+        elif pos<len(query):
+            if edit=='delete':
+                del query[pos]
+            else:
+                query[pos] = rnd.choice('abcd')
+    query = ''.join(query)
+    return ' '+query.upper()+' ' if rnd.random()<0.1 else query
+
+def test_search():
+    rnd = random.Random(1)
+    names = set()
+    while len(names)<300:
+        names.add(' '.join(''.join(rnd.choice('abcd') for x in range(rnd.randint(2,6))) for y in range(rnd.randint(1,3))))
+    names = sorted(names)
+    index = AuSearchIndex(names)
+    for n in range(300):
+        query = random_query(rnd,names)
+        assert index.search(query)==search_all(query,names), query
+        name_choices = rnd.sample(names,100)
+        assert index.search(query,name_choices)==search_all(query,name_choices), query
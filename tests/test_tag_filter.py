@@ -0,0 +1,67 @@
+# AuEngine.compile_tag_filter: precedence, quoting and errors
+
+import random
+from os import path, makedirs
+
+import pytest
+
+from lib_artist_util import engine
+from lib_artist_util.engine import AuEngine
+
+TAGS = ['favorite','digital','Comic','oil painting']
+
+@pytest.fixture
+def au(tmp_path, monkeypatch):
+    monkeypatch.setattr(engine,'PREFETCH_NAMES',0)
+    monkeypatch.setattr(engine,'THUMBNAIL_DISK_CACHE',False)
+    rnd = random.Random(1)
+    folder = str(tmp_path)
+    makedirs(path.join(folder,'tags'))
+    names = ['name '+str(n) for n in range(200)]
+    with open(path.join(folder,'names.txt'),'w',encoding='utf-8') as f:
+        f.write('\n'.join(names))
+    for tag_name in TAGS:
+        with open(path.join(folder,'tags',tag_name+'.txt'),'w',encoding='utf-8') as f:
+            f.write('\n'.join(x for x in names if rnd.random()<0.5))
+    return AuEngine(path.join(folder,''))
+
+def test_precedence(au):
+    names = set(au.all_names_list)
+    fav, dig, com, oil = [au.tag_sets[x] for x in TAGS]
+    cases = [
+        ('favorite',fav),
+        ('not favorite',names-fav),
+        ('favorite or digital and Comic',fav|(dig&com)),
+        ('(favorite or digital) and Comic',(fav|dig)&com),
+        ('not favorite and digital',(names-fav)&dig),
+        ('not (favorite and digital)',names-(fav&dig)),
+        ('favorite and not digital or Comic',(fav-dig)|com),
+        ('!favorite & digital | Comic',((names-fav)&dig)|com),
+        ('not not favorite',fav),
+        ('FAVORITE AND comic',fav&com),
+        ('"oil painting" and not "Comic"',oil-com),
+        ('"Oil Painting"|(favorite&!digital)',oil|(fav-dig)),
+    ]
+    for expression, expected in cases:
+        assert au.compile_tag_filter(expression)(names)==expected, expression
+
+def test_empty(au):
+    assert au.compile_tag_filter('')==None
+    assert au.compile_tag_filter('   ')==None
+
+def test_errors(au):
+    cases = [
+        ('oil painting','unknown tag "oil"'),
+        ('nothing','unknown tag "nothing"'),
+        ('favorite and','unexpected None'),
+        ('(favorite','missing )'),
+        ('favorite)','unexpected )'),
+        ('favorite digital','unexpected digital'),
+        ('or favorite','unexpected |'),
+        ('"oil painting','missing "'),
+        ('""','unknown tag ""'),
+    ]
+    for expression, message in cases:
+        with pytest.raises(ValueError) as e:
+            au.compile_tag_filter(expression)
+        assert str(e.value)==message, expression